@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compares JSON backends (and response compression) when encoding a list of
+1,000 deployments, as returned by GET /deployments.
+
+Usage:
+    PYTHONPATH=. python benchmarks/bench_json_encoding.py
+"""
+import argparse
+import datetime
+import gzip
+import timeit
+
+from flask import Flask
+
+from seed.encoding import (BROTLI_QUALITY, GZIP_LEVEL, JSON_BACKEND_ORJSON,
+                           JSON_BACKEND_STDLIB, JsonEncoder, brotli, dumps,
+                           orjson)
+from seed.models import Deployment, DeploymentImage, DeploymentTarget
+from seed.schema import DeploymentListResponseSchema
+
+
+def _deployments(total):
+    target = DeploymentTarget(
+        id=1, name='Cluster', namespace='lemonade', enabled=True,
+        description='Kubernetes cluster', base_service_url='http://k8s',
+        target_type='KUBERNETES')
+    image = DeploymentImage(id=1, description='MLeap', name='mleap',
+                            tag='latest', enabled=True)
+    now = datetime.datetime.utcnow()
+    return [Deployment(
+        id=i, name=f'Deployment {i}', version=1, internal_name=f'd-{i}',
+        description='Model deployed as a service', created=now,
+        updated=now, model_id=i, model_name=f'Model {i}', user_id=1,
+        user_login='admin', user_name='Administrator', enabled=True,
+        current_status='DEPLOYED', type='MODEL', attempts=0, replicas=1,
+        request_memory='128M', request_cpu='500m', limit_cpu='1000m',
+        base_service_url='http://k8s', port=31000 + i, target=target,
+        image=image, input_spec='{"fields": []}', workflow_id=i,
+        workflow_name=f'Workflow {i}', job_id=i)
+        for i in range(total)]
+
+
+def main(rows, repeat):
+    app = Flask(__name__)
+    app.config['RESTFUL_JSON'] = {'cls': JsonEncoder}
+    data = {'data': DeploymentListResponseSchema(many=True).dump(
+        _deployments(rows))}
+
+    backends = [JSON_BACKEND_STDLIB]
+    if orjson is not None:
+        backends.append(JSON_BACKEND_ORJSON)
+    else:
+        print('orjson is not installed, skipping it')
+
+    print(f'Encoding {rows} deployments ({repeat} repetitions)')
+    with app.app_context():
+        for backend in backends:
+            app.config['JSON_BACKEND'] = backend
+            elapsed = min(timeit.repeat(lambda: dumps(data), number=repeat,
+                                        repeat=3)) / repeat
+            print(f'{backend:>8}: {elapsed * 1000:8.3f} ms/dump, '
+                  f'{len(dumps(data))} bytes')
+
+        encoded = dumps(data)
+        compressors = [('gzip', lambda: gzip.compress(
+            encoded, compresslevel=GZIP_LEVEL))]
+        if brotli is not None:
+            compressors.append(('br', lambda: brotli.compress(
+                encoded, quality=BROTLI_QUALITY)))
+        for name, compress in compressors:
+            elapsed = min(timeit.repeat(compress, number=repeat,
+                                        repeat=3)) / repeat
+            print(f'{name:>8}: {elapsed * 1000:8.3f} ms/compress, '
+                  f'{len(compress())} bytes')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    main(args.rows, args.repeat)
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Per-message cost of translating job messages: a Flask request context and
+force_locale() for each message (previous ctx_gettext) vs. translations
+cached per locale (seed.translations).
+
+Usage:
+    PYTHONPATH=. python benchmarks/bench_translations.py
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import timeit
+
+from babel.messages.mofile import write_mo
+from babel.messages.pofile import read_po
+from flask import Flask
+from flask_babel import Babel, force_locale
+from flask_babel import gettext as babel_gettext
+
+from seed import translations
+
+MESSAGE = 'Error in deployment: %(error)s'
+
+
+def _compile_catalogs(target: str) -> None:
+    """Compiles the .po files, because .mo files are not versioned"""
+    source = translations.TRANSLATION_DIRECTORY
+    for locale in os.listdir(source):
+        po = os.path.join(source, locale, 'LC_MESSAGES', 'messages.po')
+        if not os.path.exists(po):
+            continue
+        directory = os.path.join(target, locale, 'LC_MESSAGES')
+        os.makedirs(directory)
+        with open(po, 'rb') as f:
+            catalog = read_po(f, locale)
+        with open(os.path.join(directory, 'messages.mo'), 'wb') as f:
+            write_mo(f, catalog)
+
+
+def main(locale, number):
+    directory = tempfile.mkdtemp()
+    try:
+        _compile_catalogs(directory)
+        translations.TRANSLATION_DIRECTORY = directory
+
+        app = Flask(__name__)
+        app.config['BABEL_TRANSLATION_DIRECTORIES'] = directory
+        Babel(app)
+
+        def request_context_gettext(msg, **variables):
+            with app.test_request_context():
+                with force_locale(locale):
+                    return babel_gettext(msg, **variables)
+
+        cached_gettext = translations.get_gettext(locale)
+        assert request_context_gettext(MESSAGE, error='x') == cached_gettext(
+            MESSAGE, error='x')
+
+        print(f'Translating "{MESSAGE}" to {locale} ({number} messages)')
+        for name, gettext in [('request context', request_context_gettext),
+                              ('cached', cached_gettext)]:
+            elapsed = min(timeit.repeat(
+                lambda: gettext(MESSAGE, error='x'), number=number,
+                repeat=3)) / number
+            print(f'{name:>16}: {elapsed * 1e6:10.2f} us/message')
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--locale', default='pt')
+    parser.add_argument('--number', type=int, default=2000)
+    args = parser.parse_args()
+    main(args.locale, args.number)
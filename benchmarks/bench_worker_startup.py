@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Cold start time and memory (max RSS) of a worker process until it is ready
+to run jobs: loading the web application (seed.app, used by
+`flask rq worker`) vs. the lightweight worker application (seed.worker).
+Each measure runs in a new Python process.
+
+Usage:
+    SEED_CONFIG=conf/seed.yaml PYTHONPATH=. \
+        python benchmarks/bench_worker_startup.py
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+TEMPLATE = '''
+import json, os, resource, time
+start = time.perf_counter()
+{code}
+import seed.jobs
+print(json.dumps({{
+    'time': time.perf_counter() - start,
+    'rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}}))
+'''
+
+BOOTSTRAPS = [
+    ('web app', 'import seed.app'),
+    ('worker', 'from seed.worker import create_worker_app\n'
+               'create_worker_app(os.environ["SEED_CONFIG"])'),
+]
+
+
+def _measure(code: str) -> dict:
+    output = subprocess.run(
+        [sys.executable, '-c', TEMPLATE.format(code=code)],
+        check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(repeat):
+    if not os.environ.get('SEED_CONFIG'):
+        print('Please, set SEED_CONFIG environment variable')
+        exit(1)
+    print(f'Worker bootstrap ({repeat} runs, median)')
+    for name, code in BOOTSTRAPS:
+        results = [_measure(code) for _ in range(repeat)]
+        elapsed = statistics.median(r['time'] for r in results)
+        rss = statistics.median(r['rss'] for r in results)
+        print(f'{name:>8}: {elapsed * 1000:8.1f} ms, {rss / 1024:6.1f} MB')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    main(args.repeat)
@@ -10,44 +10,36 @@ try:
 except:
     pass
 
-import decimal
 import logging
 import logging.config
 import os
 
 import eventlet.wsgi
 import sqlalchemy_utils
-import yaml
 from flask import Flask, request
-from flask.json import JSONEncoder
-from flask_babel import Babel, get_locale, gettext
+from flask_babel import get_locale, gettext
 from flask_cors import CORS
 from flask_migrate import Migrate
 from flask_restful import Api
 
-from seed import rq
 from seed.client_api import ClientDetailApi, ClientListApi
-from seed.deployment_api import DeploymentDetailApi, DeploymentListApi
+from seed.deployment_api import (DeploymentBatchApi, DeploymentBulkDeployApi,
+                                 DeploymentDetailApi, DeploymentDiffApi,
+                                 DeploymentListApi)
 from seed.deployment_image_api import (DeploymentImageDetailApi,
                                        DeploymentImageListApi)
 from seed.deployment_log_api import (DeploymentLogDetailApi,
                                      DeploymentLogListApi)
 from seed.deployment_metric_api import (DeploymentMetricDetailApi,
                                         DeploymentMetricListApi)
+from seed.deployment_rollout_api import DeploymentRolloutListApi
 from seed.deployment_target_api import (DeploymentTargetDetailApi,
-                                        DeploymentTargetListApi)
+                                        DeploymentTargetListApi,
+                                        DeploymentTargetQueueListApi)
+from seed.encoding import JsonEncoder, compress_response, output_json
 from seed.models import db
-
-
-class JsonEncoder(JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, decimal.Decimal):
-            return float(obj)
-        return JSONEncoder.default(self, obj)
-
-
-def create_babel(app):
-    return Babel(app)
+from seed.settings import configure_app, load_config
+from seed.translations import create_babel
 
 
 def create_app():
@@ -67,19 +59,26 @@ def create_app():
     # CORS
     CORS(app, resources={r"/*": {"origins": "*"}})
     api = Api(app)
+    api.representation('application/json')(output_json)
+    app.after_request(compress_response)
 
     mappings = {
         '/deployments': DeploymentListApi,
+        '/deployments/batch': DeploymentBatchApi,
+        '/deployments/deploy': DeploymentBulkDeployApi,
         '/deployments/<int:deployment_id>': DeploymentDetailApi,
+        '/deployments/<int:deployment_id>/diff': DeploymentDiffApi,
         '/images/<int:deployment_image_id>': DeploymentImageDetailApi,
         '/images': DeploymentImageListApi,
         '/targets/<int:deployment_target_id>': DeploymentTargetDetailApi,
+        '/targets/queues': DeploymentTargetQueueListApi,
         '/targets': DeploymentTargetListApi,
         '/clients': ClientListApi,
         '/clients/<int:client_id>': ClientDetailApi,
         '/logs': DeploymentLogListApi,
         '/logs/<int:deployment_log_id>': DeploymentLogDetailApi,
         '/metrics': DeploymentMetricListApi,
+        '/rollouts': DeploymentRolloutListApi,
         '/metrics/<int:deployment_metric_id>': DeploymentMetricDetailApi,
     }
     for path, view in list(mappings.items()):
@@ -122,28 +121,10 @@ def main(is_main_module):
     os.chdir(os.environ.get('SEED_HOME', '.'))
     logger = logging.getLogger(__name__)
     if config_file:
-        with open(config_file) as f:
-            config = yaml.load(f, Loader=yaml.FullLoader)['seed']
+        config = load_config(config_file)
 
         app.config["RESTFUL_JSON"] = {"cls": app.json_encoder}
-
-        server_config = config.get('servers', {})
-        app.config['SQLALCHEMY_DATABASE_URI'] = server_config.get(
-            'database_url')
-        app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-        app.config['SQLALCHEMY_POOL_SIZE'] = 10
-        app.config['SQLALCHEMY_POOL_RECYCLE'] = 240
-
-        app.config['RQ_REDIS_URL'] = config['servers']['redis_url']
-
-        app.config['BABEL_TRANSLATION_DIRECTORIES'] = 'i18n/locales'
-        app.config['BABEL_DEFAULT_LOCALE'] = 'UTC'
-
-        app.config.update(config.get('config', {}))
-        app.config['SEED_CONFIG'] = config
-
-        db.init_app(app)
-        rq.init_app(app)
+        configure_app(app, config)
 
         # RQ Dashboard
         # app.config.from_object(rq_dashboard.default_settings)
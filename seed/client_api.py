@@ -1,5 +1,4 @@
 # -*- coding: utf-8 -*-}
-import math
 import logging
 
 from seed.app_auth import requires_auth, requires_permission
@@ -9,8 +8,10 @@ from sqlalchemy import or_
 from http import HTTPStatus
 from marshmallow.exceptions import ValidationError
 
+from seed.pagination import get_count_strategy, get_page_size, paginate
 from seed.schema import *
-from seed.util import translate_validation
+from seed.util import (load_only_fields, ndjson_response,
+                       translate_validation, wants_ndjson)
 from flask_babel import gettext
 
 log = logging.getLogger(__name__)
@@ -29,6 +30,9 @@ class ClientListApi(Resource):
         else:
             only = ('id', ) if request.args.get(
                 'simple', 'false') == 'true' else None
+        list_schema = get_schema(
+            ClientListResponseSchema, many=True, only=only)
+        count = get_count_strategy(request.args.get('count'))
         enabled_filter = request.args.get('enabled')
         if enabled_filter:
             clients = Client.query.filter(
@@ -36,23 +40,29 @@ class ClientListApi(Resource):
         else:
             clients = Client.query
 
+        clients = load_only_fields(clients, Client, only)
+
+        if wants_ndjson():
+            return ndjson_response(clients, get_schema(
+                ClientListResponseSchema, only=only))
+
+        page_size = get_page_size(request.args.get('size'))
+        if page_size is None:
+            return {'status': 'ERROR',
+                    'message': gettext('Invalid page size.')}, \
+                HTTPStatus.BAD_REQUEST
         page = request.args.get('page') or '1'
         if page is not None and page.isdigit():
-            page_size = int(request.args.get('size', 20))
             page = int(page)
-            pagination = clients.paginate(page, page_size, True)
+            items, pagination = paginate(
+                clients, page, page_size, count)
             result = {
-                'data': ClientListResponseSchema(
-                    many=True, only=only).dump(pagination.items),
-                'pagination': {
-                    'page': page, 'size': page_size,
-                    'total': pagination.total,
-                    'pages': int(math.ceil(1.0 * pagination.total / page_size))}
+                'data': list_schema.dump(items),
+                'pagination': pagination
             }
         else:
             result = {
-                'data': ClientListResponseSchema(
-                    many=True, only=only).dump(
+                'data': list_schema.dump(
                     clients)}
 
         if log.isEnabledFor(logging.DEBUG):
@@ -67,7 +77,7 @@ class ClientListApi(Resource):
         
         if request.json is not None:
             request_schema = ClientCreateRequestSchema()
-            response_schema = ClientItemResponseSchema()
+            response_schema = get_schema(ClientItemResponseSchema)
             client = request_schema.load(request.json)
             try:
                 if log.isEnabledFor(logging.DEBUG):
@@ -114,7 +124,7 @@ class ClientDetailApi(Resource):
         if client is not None:
             result = {
                 'status': 'OK',
-                'data': [ClientItemResponseSchema().dump(
+                'data': [get_schema(ClientItemResponseSchema).dump(
                     client)]
             }
         else:
@@ -173,7 +183,7 @@ class ClientDetailApi(Resource):
                 ClientCreateRequestSchema)
             # Ignore missing fields to allow partial updates
             client = request_schema.load(request.json, partial=True)
-            response_schema = ClientItemResponseSchema()
+            response_schema = get_schema(ClientItemResponseSchema)
             try:
                 client.id = client_id
                 client = db.session.merge(client)
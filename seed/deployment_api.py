@@ -1,7 +1,8 @@
 import logging
-import math
+import uuid
+from collections import defaultdict
 from http import HTTPStatus
-from typing import Any, Callable
+from typing import Any, Callable, List, Optional, Tuple
 
 from flask import current_app
 from flask import g as flask_globals
@@ -9,22 +10,158 @@ from flask import request
 from flask_babel import gettext
 from flask_restful import Resource
 from marshmallow.exceptions import ValidationError
-from sqlalchemy import or_
-
-from seed import jobs
-from seed.app_auth import requires_auth, requires_permission
+from rq import Queue
+from rq.exceptions import NoSuchJobError
+from rq.job import Job, JobStatus
+from rq.queue import EnqueueData
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload
+
+from seed import jobs, rq, scheduling
+from seed.app_auth import requires_auth
+from seed.k8s_crud import create_deployment
+from seed.manifests import ManifestError
 from seed.models import DeploymentStatus as DStatus
+from seed.pagination import (COUNT_EXACT, get_count_strategy,
+                             get_page_size, keyset_paginate, paginate)
 from seed.schema import *
-from seed.util import get_internal_name, translate_validation
+from seed.util import (conditional_headers, get_internal_name,
+                       load_only_fields, ndjson_response, not_modified,
+                       translate_validation, wants_ndjson)
 
 log = logging.getLogger(__name__)
 # region Protected
 
-
-def schedule_deployment_job(deployment_id: int, locale: str, action: Callable):
+# Columns required by serialized fields that are not mapped columns
+_FIELD_COLUMNS = {
+    'user': ['user_id', 'user_name', 'user_login'],
+    'workflow': ['workflow_id', 'workflow_name'],
+    'job': ['job_id'],
+    'target': ['target_id'],
+    'image': ['image_id'],
+}
+
+# Jobs that change a single deployment and can be superseded
+_SINGLE_JOBS = {f'{action.__module__}.{action.__name__}'
+                for action in (jobs.deploy, jobs.undeploy)}
+
+
+def schedule_deployment_job(deployment: Deployment, locale: str,
+                            action: Callable) -> str:
+    """Commits pending changes and schedules a job for the deployment,
+    superseding the previous one (see prepare_deployment_job()).
+    Returns the id of the job.
+    """
+    superseded = deployment.execution_id
+    queue_name, job_data = prepare_deployment_job(deployment, locale, action)
+    db.session.add(deployment)
+    db.session.commit()
+    enqueue_deployment_jobs([(queue_name, job_data)],
+                            [(deployment.id, superseded)])
+    return job_data.job_id
+
+
+def prepare_deployment_job(deployment: Deployment, locale: str,
+                           action: Callable) -> Tuple[str, EnqueueData]:
+    """Prepares (but does not enqueue) a job. See enqueue_deployment_jobs().
+    The job id is generated in advance and stored in the deployment
+    (execution_id) before the job is enqueued. Returns the job and the queue
+    of the deployment target (see seed.scheduling), where it must be
+    enqueued.
+
+    Deployment version is incremented and passed to the job, so a job
+    superseded by a newer one for the same deployment skips its work.
+    Attempts (retries of the job, see jobs.MAX_ATTEMPTS) start over.
+    """
     user_id = flask_globals.user.id
-    return action.queue(deployment_id, locale, user_id, 
-        timeout=60, result_ttl=3600)
+    deployment.version = (deployment.version or 0) + 1
+    deployment.attempts = 0
+    job_data = Queue.prepare_data(
+        action, (deployment.id, locale, user_id, deployment.version),
+        timeout=60, result_ttl=3600, job_id=str(uuid.uuid4()))
+    deployment.execution_id = job_data.job_id
+    return scheduling.target_queue_name(deployment.target_id), job_data
+
+
+def enqueue_deployment_jobs(
+        job_datas: List[Tuple[str, EnqueueData]],
+        superseded: Optional[List[Tuple[int, Optional[str]]]] = None
+) -> List[Job]:
+    """Enqueues many jobs, given as (queue name, job), using a single Redis
+    pipeline (one round trip). Superseded jobs, given as (deployment id,
+    job id), are cancelled if they are still queued.
+    """
+    result = []
+    by_queue = defaultdict(list)
+    for queue_name, job_data in job_datas:
+        by_queue[queue_name].append(job_data)
+    if by_queue:
+        with rq.connection.pipeline() as pipe:
+            for queue_name, queue_jobs in by_queue.items():
+                result.extend(rq.get_queue(queue_name).enqueue_many(
+                    queue_jobs, pipeline=pipe))
+            pipe.execute()
+    for deployment_id, job_id in superseded or []:
+        if job_id:
+            _cancel_queued_job(deployment_id, job_id)
+    return result
+
+
+def _cancel_queued_job(deployment_id: int, job_id: str) -> None:
+    """Cancels a deploy/undeploy job of the deployment if it did not start
+    (queued or waiting to be retried).
+    Jobs that already started skip their work anyway, because the
+    deployment version changed. Bulk jobs (shared by many deployments)
+    are never cancelled.
+    """
+    try:
+        job = Job.fetch(job_id, connection=rq.connection)
+        if (job.func_name in _SINGLE_JOBS and job.args
+                and job.args[0] == deployment_id
+                and job.get_status(refresh=False) in (JobStatus.QUEUED,
+                                                      JobStatus.SCHEDULED)):
+            job.cancel()
+            log.info('Job %s superseded for deployment %s', job_id,
+                     deployment_id)
+    except NoSuchJobError:
+        pass
+    except Exception:
+        # A job that is not cancelled is skipped when it runs
+        log.exception('Unable to cancel job %s', job_id)
+
+
+def _change_status(deployment: Deployment, must_deploy: bool,
+                   must_undeploy: bool) -> Optional[Callable]:
+    """Updates the status of an existing deployment, according to the
+    requested action, and returns the job that must be scheduled (if any).
+    """
+    deployed = [DStatus.PENDING_UNDEPLOY, DStatus.DEPLOYED_OLD,
+                DStatus.DEPLOYED]
+    if must_deploy:
+        if deployment.current_status in deployed:
+            deployment.current_status = DStatus.DEPLOYED_OLD
+        else:
+            deployment.current_status = DStatus.PENDING
+        return jobs.deploy
+    elif must_undeploy:
+        if deployment.current_status in deployed:
+            deployment.current_status = DStatus.PENDING_UNDEPLOY
+            return jobs.undeploy
+    else:
+        deployment.current_status = DStatus.DEPLOYED_OLD
+    return None
+
+
+def _load_related(query, only):
+    """Eager loads the nested associations that will be serialized.
+    Target and image are many-to-one, so a JOIN avoids one lazy SELECT
+    per row when dumping a page.
+    """
+    for name in ('target', 'image'):
+        if only is None or any(f == name or f.startswith(name + '.')
+                               for f in only):
+            query = query.options(joinedload(getattr(Deployment, name)))
+    return query
 
 # endregion
 
@@ -42,6 +179,8 @@ class DeploymentListApi(Resource):
         else:
             only = ('id', ) if request.args.get(
                 'simple', 'false') == 'true' else None
+        list_schema = get_schema(
+            DeploymentListResponseSchema, many=True, only=only)
         enabled_filter = request.args.get('enabled')
         if enabled_filter:
             deployments = Deployment.query.filter(
@@ -49,38 +188,85 @@ class DeploymentListApi(Resource):
         else:
             deployments = Deployment.query
 
+        # Keyset pagination reads the sort value of the last row
+        keyset = 'cursor' in request.args
+        count = get_count_strategy(request.args.get('count'))
+
+        headers = {}
+        total = None
+        if not wants_ndjson():
+            # Conditional GET: validators are computed before reading rows.
+            # If an exact count is required, it is computed here too.
+            if count == COUNT_EXACT and not keyset:
+                last_modified, total = deployments.with_entities(
+                    func.max(Deployment.updated),
+                    func.count(Deployment.id)).one()
+                version = total
+            else:
+                last_modified, version = deployments.with_entities(
+                    func.max(Deployment.updated),
+                    func.max(Deployment.id)).one()
+            headers = conditional_headers(last_modified, version)
+            response = not_modified(headers)
+            if response is not None:
+                return response
+
+        deployments = _load_related(deployments, only)
+
         sort = request.args.get('sort', 'name')
         if sort not in ['id', 'name', 'type', 'created', 'updated',
                         'current_status']:
             sort = 'name'
+        asc = request.args.get('asc', 'true') != 'false'
         sort_option = getattr(Deployment, sort)
-        if request.args.get('asc', 'true') == 'false':
+        if not asc:
             sort_option = sort_option.desc()
         deployments = deployments.order_by(sort_option)
-
+        deployments = load_only_fields(deployments, Deployment, only,
+                                       _FIELD_COLUMNS,
+                                       [sort] if keyset else None)
+
+        if wants_ndjson():
+            return ndjson_response(deployments, get_schema(
+                DeploymentListResponseSchema, only=only))
+
+        page_size = get_page_size(request.args.get('size'))
+        if page_size is None:
+            return {'status': 'ERROR',
+                    'message': gettext('Invalid page size.')}, \
+                HTTPStatus.BAD_REQUEST
         page = request.args.get('page') or '1'
-        if page is not None and page.isdigit():
-            page_size = int(request.args.get('size', 20))
+        if keyset:
+            # Keyset pagination: no COUNT(*) and no OFFSET scan
+            try:
+                items, next_cursor = keyset_paginate(
+                    deployments, getattr(Deployment, sort), Deployment.id,
+                    sort, asc, page_size, request.args.get('cursor'))
+            except ValueError:
+                return {'status': 'ERROR',
+                        'message': gettext('Invalid cursor.')}, \
+                    HTTPStatus.BAD_REQUEST
+            result = {
+                'data': list_schema.dump(items),
+                'pagination': {'size': page_size, 'next': next_cursor}
+            }
+        elif page is not None and page.isdigit():
             page = int(page)
-            pagination = deployments.paginate(page, page_size, True)
+            items, pagination = paginate(
+                deployments, page, page_size, count, total)
             result = {
-                'data': DeploymentListResponseSchema(
-                    many=True, only=only).dump(pagination.items),
-                'pagination': {
-                    'page': page, 'size': page_size,
-                    'total': pagination.total,
-                    'pages': int(math.ceil(1.0 * pagination.total / page_size))}
+                'data': list_schema.dump(items),
+                'pagination': pagination
             }
         else:
             result = {
-                'data': DeploymentListResponseSchema(
-                    many=True, only=only).dump(
+                'data': list_schema.dump(
                     deployments)}
 
         if log.isEnabledFor(logging.DEBUG):
             log.debug(gettext('Listing %(name)s', name=self.human_name))
 
-        return result
+        return result, HTTPStatus.OK, headers
 
     @requires_auth
     def post(self):
@@ -99,7 +285,7 @@ class DeploymentListApi(Resource):
                 'True', 'true', 1)
 
             request_schema = DeploymentCreateRequestSchema()
-            response_schema = DeploymentItemResponseSchema()
+            response_schema = get_schema(DeploymentItemResponseSchema)
             try:
                 deployment = request_schema.load(request.json)
                 if log.isEnabledFor(logging.DEBUG):
@@ -109,16 +295,16 @@ class DeploymentListApi(Resource):
                 db.session.add(deployment)
 
                 db.session.flush()
+                deployment.enabled = True
                 if must_deploy:
-                    deployment.execution_id = schedule_deployment_job(
-                        deployment.id,  flask_globals.user.locale, jobs.deploy)
                     deployment.current_status = DStatus.PENDING
+                    # Job is enqueued after commit
+                    schedule_deployment_job(
+                        deployment, flask_globals.user.locale, jobs.deploy)
                 else:
                     deployment.current_status = DStatus.SAVED
-                
-                deployment.enabled = True
-                db.session.add(deployment)
-                db.session.commit()
+                    db.session.add(deployment)
+                    db.session.commit()
                 result = response_schema.dump(deployment)
                 return_code = HTTPStatus.CREATED
             except ValidationError as e:
@@ -154,12 +340,26 @@ class DeploymentDetailApi(Resource):
             log.debug(gettext('Retrieving %s (id=%s)'), self.human_name,
                       deployment_id)
 
-        deployment = Deployment.query.get(deployment_id)
+        headers = {}
+        validator = db.session.query(
+            Deployment.updated, Deployment.version).filter(
+                Deployment.id == deployment_id).first()
+        if validator is not None:
+            headers = conditional_headers(validator.updated, deployment_id,
+                                          validator.version)
+            response = not_modified(headers)
+            if response is not None:
+                return response
+            deployment = _load_related(Deployment.query, None).get(
+                deployment_id)
+        else:
+            deployment = None
+
         return_code = HTTPStatus.OK
         if deployment is not None:
             result = {
                 'status': 'OK',
-                'data': [DeploymentItemResponseSchema().dump(
+                'data': [get_schema(DeploymentItemResponseSchema).dump(
                     deployment)]
             }
         else:
@@ -171,7 +371,7 @@ class DeploymentDetailApi(Resource):
                     name=self.human_name, id=deployment_id)
             }
 
-        return result, return_code
+        return result, return_code, headers
 
     @requires_auth
     def delete(self, deployment_id: int) -> Any:
@@ -184,18 +384,17 @@ class DeploymentDetailApi(Resource):
         deployment = Deployment.query.get(deployment_id)
         if deployment is not None:
             try:
+                deployment.enabled = False
                 if deployment.current_status in [DStatus.DEPLOYED,
                                                  DStatus.DEPLOYED_OLD]:
                     deployment.current_status = DStatus.PENDING_UNDEPLOY
                     schedule_deployment_job(
-                        deployment.id, flask_globals.user.locale, jobs.undeploy)
-                elif deployment.current_status == DStatus.PENDING_UNDEPLOY:
-                    pass  # Nothing to do
+                        deployment, flask_globals.user.locale, jobs.undeploy)
                 else:
-                    deployment.current_status = DStatus.SUSPENDED
-                deployment.enabled = False
-                db.session.add(deployment)
-                db.session.commit()
+                    if deployment.current_status != DStatus.PENDING_UNDEPLOY:
+                        deployment.current_status = DStatus.SUSPENDED
+                    db.session.add(deployment)
+                    db.session.commit()
                 result = {
                     'status': 'OK',
                     'message': gettext('%(name)s changed with success!',
@@ -236,7 +435,7 @@ class DeploymentDetailApi(Resource):
                 DeploymentCreateRequestSchema)
             # Ignore missing fields to allow partial updates
             deployment = request_schema.load(request.json, partial=True)
-            response_schema = DeploymentItemResponseSchema()
+            response_schema = get_schema(DeploymentItemResponseSchema)
             try:
                 deployment.id = deployment_id
                 if (deployment.internal_name is None
@@ -260,9 +459,7 @@ class DeploymentDetailApi(Resource):
                         else:
                             deployment.current_status = DStatus.PENDING
 
-                        db.session.add(deployment)
-                        db.session.commit()
-                        schedule_deployment_job(deployment.id,
+                        schedule_deployment_job(deployment,
                                                 flask_globals.user.locale,
                                                 jobs.deploy)
                     elif must_undeploy:
@@ -270,11 +467,9 @@ class DeploymentDetailApi(Resource):
                                 DStatus.PENDING_UNDEPLOY, DStatus.DEPLOYED_OLD, 
                                 DStatus.DEPLOYED]:
                             deployment.current_status = DStatus.PENDING_UNDEPLOY
-                            db.session.add(deployment)
-                            db.session.commit()
-                            schedule_deployment_job(deployment.id,
-                                                flask_globals.user.locale,
-                                                jobs.undeploy)
+                            schedule_deployment_job(deployment,
+                                                    flask_globals.user.locale,
+                                                    jobs.undeploy)
                     else:
                         deployment.current_status = DStatus.DEPLOYED_OLD
                         db.session.add(deployment)
@@ -307,3 +502,292 @@ class DeploymentDetailApi(Resource):
                 log.exception(e)
                 db.session.rollback()
         return result, return_code
+
+
+class DeploymentBatchApi(Resource):
+    """ REST API for creating or updating many instances of class Deployment
+    in a single transaction """
+
+    MAX_BATCH_SIZE = 500
+
+    def __init__(self):
+        self.human_name = gettext('Deployment')
+
+    @requires_auth
+    def post(self):
+        """Each item in the request body (a JSON list) is either a new
+        deployment (no id) or a partial update of an existing one. Items may
+        include the flags deploy or undeploy. Changes are applied only if all
+        items are valid.
+        """
+        changes = request.json
+        if not isinstance(changes, list) or len(changes) == 0:
+            return {'status': 'ERROR',
+                    'message': gettext('Insufficient data.')}, \
+                HTTPStatus.BAD_REQUEST
+        if len(changes) > self.MAX_BATCH_SIZE:
+            return {'status': 'ERROR',
+                    'message': gettext(
+                        'Too many items (maximum is %(max)s).',
+                        max=self.MAX_BATCH_SIZE)}, \
+                HTTPStatus.BAD_REQUEST
+
+        ids = [c.get('id') for c in changes
+               if isinstance(c, dict) and c.get('id') is not None]
+        existing = {d.id: d for d in Deployment.query.options(
+            joinedload(Deployment.target)).filter(
+                Deployment.id.in_(ids))} if ids else {}
+
+        now = datetime.datetime.utcnow().isoformat()
+        create_schema = get_schema(DeploymentCreateRequestSchema)
+        update_schema = partial_schema_factory(DeploymentCreateRequestSchema)
+
+        # Validation: nothing is changed if any item is invalid
+        results = []
+        loaded = []
+        for i, change in enumerate(changes):
+            result = {'index': i, 'status': 'OK'}
+            results.append(result)
+            if not isinstance(change, dict):
+                result.update({'status': 'ERROR',
+                               'message': gettext('Insufficient data.')})
+                continue
+            change = dict(change)
+            must_deploy = change.pop('deploy', 'False') in (
+                'True', 'true', 1)
+            must_undeploy = change.pop('undeploy', 'False') in (
+                'True', 'true', 1)
+            deployment_id = change.pop('id', None)
+            try:
+                if deployment_id is None:
+                    change.update({
+                        'created': now, 'updated': now, 'version': 1,
+                        'user_id': flask_globals.user.id,
+                        'user_login': flask_globals.user.login,
+                        'user_name': flask_globals.user.name})
+                    deployment = create_schema.load(change)
+                elif deployment_id not in existing:
+                    result.update({
+                        'id': deployment_id, 'status': 'ERROR',
+                        'message': gettext('%(name)s not found (id=%(id)s).',
+                                           name=self.human_name,
+                                           id=deployment_id)})
+                    continue
+                else:
+                    deployment = update_schema.load(change, partial=True)
+                    deployment.id = deployment_id
+                loaded.append((result, deployment, must_deploy,
+                               must_undeploy))
+            except ValidationError as e:
+                result.update({
+                    'status': 'ERROR',
+                    'message': gettext('Invalid data for %(name)s.',
+                                       name=self.human_name),
+                    'errors': translate_validation(e.messages)})
+
+        if any(r['status'] == 'ERROR' for r in results):
+            return {'status': 'ERROR',
+                    'message': gettext('Invalid data for %(name)s.',
+                                       name=self.human_name),
+                    'data': results}, HTTPStatus.BAD_REQUEST
+
+        locale = flask_globals.user.locale
+        job_datas = []
+        superseded = []
+        try:
+            for result, deployment, must_deploy, must_undeploy in loaded:
+                if deployment.id is None:
+                    result['action'] = 'created'
+                    db.session.add(deployment)
+                    db.session.flush()
+                    deployment.internal_name = get_internal_name(deployment)
+                    deployment.enabled = True
+                    if must_deploy:
+                        deployment.current_status = DStatus.PENDING
+                        action = jobs.deploy
+                    else:
+                        deployment.current_status = DStatus.SAVED
+                        action = None
+                else:
+                    result['action'] = 'updated'
+                    if not deployment.internal_name:
+                        deployment.internal_name = get_internal_name(
+                            deployment)
+                    deployment = db.session.merge(deployment)
+                    deployment.base_service_url = \
+                        deployment.target.base_service_url
+                    action = _change_status(deployment, must_deploy,
+                                            must_undeploy)
+                if action is not None:
+                    superseded.append((deployment.id,
+                                       deployment.execution_id))
+                    queue_name, job_data = prepare_deployment_job(
+                        deployment, locale, action)
+                    result['execution_id'] = job_data.job_id
+                    job_datas.append((queue_name, job_data))
+                result['id'] = deployment.id
+                result['current_status'] = deployment.current_status
+            db.session.commit()
+        except Exception as e:
+            result = {'status': 'ERROR',
+                      'message': gettext("Internal error")}
+            if current_app.debug:
+                result['debug_detail'] = str(e)
+            log.exception(e)
+            db.session.rollback()
+            return result, HTTPStatus.INTERNAL_SERVER_ERROR
+
+        # Jobs are enqueued only after commit, so workers see the changes
+        enqueue_deployment_jobs(job_datas, superseded)
+
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug(gettext('Batch of %(count)s %(name)s applied',
+                              count=len(results), name=self.human_name))
+        return {'status': 'OK', 'data': results}, HTTPStatus.OK
+
+
+
+class DeploymentBulkDeployApi(Resource):
+    """ REST API for deploying many instances of class Deployment in a
+    single job per deployment target """
+
+    MAX_BULK_SIZE = 1000
+    # Job timeout, per deployment (seconds)
+    JOB_TIMEOUT_PER_DEPLOYMENT = 10
+
+    def __init__(self):
+        self.human_name = gettext('Deployment')
+
+    @requires_auth
+    def post(self):
+        """Request body is {"ids": [...]}. Deployments of each target are
+        deployed by a single job (see jobs.deploy_many), enqueued in the
+        queue of the target (see seed.scheduling), so bulk deploys respect
+        the limits of targets. The id of the job of each deployment is
+        returned as its execution_id.
+        """
+        ids = request.json.get('ids') if isinstance(
+            request.json, dict) else None
+        if (not isinstance(ids, list) or len(ids) == 0
+                or not all(isinstance(i, int) for i in ids)):
+            return {'status': 'ERROR',
+                    'message': gettext('Insufficient data.')}, \
+                HTTPStatus.BAD_REQUEST
+        ids = list(dict.fromkeys(ids))
+        if len(ids) > self.MAX_BULK_SIZE:
+            return {'status': 'ERROR',
+                    'message': gettext(
+                        'Too many items (maximum is %(max)s).',
+                        max=self.MAX_BULK_SIZE)}, \
+                HTTPStatus.BAD_REQUEST
+
+        deployments = Deployment.query.options(
+            joinedload(Deployment.target)).filter(
+                Deployment.id.in_(ids)).all()
+        missing = set(ids) - {d.id for d in deployments}
+        if missing:
+            return {'status': 'ERROR',
+                    'message': gettext('%(name)s not found (id=%(id)s).',
+                                       name=self.human_name,
+                                       id=', '.join(
+                                           str(i) for i in sorted(missing)))
+                    }, HTTPStatus.NOT_FOUND
+
+        by_target = defaultdict(list)
+        for deployment in deployments:
+            by_target[deployment.target_id].append(deployment)
+        execution_ids = {target_id: str(uuid.uuid4())
+                         for target_id in by_target}
+        superseded = []
+        versions = {}
+        try:
+            for deployment in deployments:
+                if not deployment.internal_name:
+                    deployment.internal_name = get_internal_name(deployment)
+                deployment.base_service_url = \
+                    deployment.target.base_service_url
+                _change_status(deployment, True, False)
+                superseded.append((deployment.id, deployment.execution_id))
+                deployment.version = (deployment.version or 0) + 1
+                deployment.attempts = 0
+                versions[deployment.id] = deployment.version
+                deployment.execution_id = execution_ids[
+                    deployment.target_id]
+            db.session.commit()
+        except Exception as e:
+            result = {'status': 'ERROR',
+                      'message': gettext("Internal error")}
+            if current_app.debug:
+                result['debug_detail'] = str(e)
+            log.exception(e)
+            db.session.rollback()
+            return result, HTTPStatus.INTERNAL_SERVER_ERROR
+
+        # Enqueued only after commit, so workers see the changes
+        locale = flask_globals.user.locale
+        user_id = flask_globals.user.id
+        job_datas = []
+        for target_id, target_deployments in by_target.items():
+            target_ids = [d.id for d in target_deployments]
+            job_datas.append((
+                scheduling.target_queue_name(target_id),
+                Queue.prepare_data(
+                    jobs.deploy_many,
+                    (target_ids, locale, user_id,
+                     {i: versions[i] for i in target_ids}),
+                    job_id=execution_ids[target_id], result_ttl=3600,
+                    timeout=60 + self.JOB_TIMEOUT_PER_DEPLOYMENT * len(
+                        target_ids))))
+        enqueue_deployment_jobs(job_datas, superseded)
+
+        return {'status': 'OK',
+                'data': [{'id': d.id, 'current_status': d.current_status,
+                          'execution_id': d.execution_id}
+                         for d in deployments]}, HTTPStatus.OK
+
+
+class DeploymentDiffApi(Resource):
+    """ REST API for previewing a deploy (dry run): differences between the
+    resources in the Kubernetes cluster and the manifests of a Deployment
+    """
+
+    def __init__(self):
+        self.human_name = gettext('Deployment')
+
+    @requires_auth
+    def get(self, deployment_id: int):
+        deployment = _load_related(Deployment.query, None).get(deployment_id)
+        if deployment is None:
+            return {'status': 'ERROR',
+                    'message': gettext('%(name)s not found (id=%(id)s)',
+                                       name=self.human_name,
+                                       id=deployment_id)
+                    }, HTTPStatus.NOT_FOUND
+        target = deployment.target
+        if target.target_type != DeploymentTargetType.KUBERNETES:
+            return {'status': 'ERROR',
+                    'message': gettext(
+                        'Deployment target %(type)s not supported',
+                        type=target.target_type)}, HTTPStatus.BAD_REQUEST
+        try:
+            deployment.internal_name = get_internal_name(deployment)
+            changes = create_deployment(
+                deployment, deployment.image, target,
+                jobs.get_api(target, gettext), dry_run=True)
+            result = {'status': 'OK', 'data': dict(
+                changes, changed=any(changes.values()))}
+            return_code = HTTPStatus.OK
+        except ManifestError as e:
+            result = {'status': 'ERROR', 'message': str(e)}
+            return_code = HTTPStatus.BAD_REQUEST
+        except Exception as e:
+            result = {'status': 'ERROR',
+                      'message': gettext("Internal error")}
+            return_code = HTTPStatus.INTERNAL_SERVER_ERROR
+            if current_app.debug:
+                result['debug_detail'] = str(e)
+            log.exception(e)
+        finally:
+            # Nothing is changed by a dry run
+            db.session.rollback()
+        return result, return_code
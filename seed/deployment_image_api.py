@@ -1,4 +1,3 @@
-import math
 import logging
 
 from seed.app_auth import requires_auth, requires_permission
@@ -8,8 +7,10 @@ from sqlalchemy import or_
 from http import HTTPStatus
 from marshmallow.exceptions import ValidationError
 
+from seed.pagination import get_count_strategy, get_page_size, paginate
 from seed.schema import *
-from seed.util import translate_validation
+from seed.util import (load_only_fields, ndjson_response,
+                       translate_validation, wants_ndjson)
 from flask_babel import gettext
 
 log = logging.getLogger(__name__)
@@ -28,6 +29,9 @@ class DeploymentImageListApi(Resource):
         else:
             only = ('id', ) if request.args.get(
                 'simple', 'false') == 'true' else None
+        list_schema = get_schema(
+            DeploymentImageListResponseSchema, many=True, only=only)
+        count = get_count_strategy(request.args.get('count'))
         enabled_filter = request.args.get('enabled')
         if enabled_filter:
             deployment_images = DeploymentImage.query.filter(
@@ -41,23 +45,30 @@ class DeploymentImageListApi(Resource):
                     DeploymentImage.name.like(find_pattern),
                     DeploymentImage.user_name.like(find_pattern)))
 
+        deployment_images = load_only_fields(
+            deployment_images, DeploymentImage, only)
+
+        if wants_ndjson():
+            return ndjson_response(deployment_images, get_schema(
+                DeploymentImageListResponseSchema, only=only))
+
+        page_size = get_page_size(request.args.get('size'))
+        if page_size is None:
+            return {'status': 'ERROR',
+                    'message': gettext('Invalid page size.')}, \
+                HTTPStatus.BAD_REQUEST
         page = request.args.get('page') or '1'
         if page is not None and page.isdigit():
-            page_size = int(request.args.get('size', 20))
             page = int(page)
-            pagination = deployment_images.paginate(page, page_size, True)
+            items, pagination = paginate(
+                deployment_images, page, page_size, count)
             result = {
-                'data': DeploymentImageListResponseSchema(
-                    many=True, only=only).dump(pagination.items),
-                'pagination': {
-                    'page': page, 'size': page_size,
-                    'total': pagination.total,
-                    'pages': int(math.ceil(1.0 * pagination.total / page_size))}
+                'data': list_schema.dump(items),
+                'pagination': pagination
             }
         else:
             result = {
-                'data': DeploymentImageListResponseSchema(
-                    many=True, only=only).dump(
+                'data': list_schema.dump(
                     deployment_images)}
 
         if log.isEnabledFor(logging.DEBUG):
@@ -73,7 +84,7 @@ class DeploymentImageListApi(Resource):
         if request.json is not None:
             try:
                 request_schema = DeploymentImageCreateRequestSchema()
-                response_schema = DeploymentImageItemResponseSchema()
+                response_schema = get_schema(DeploymentImageItemResponseSchema)
                 deployment_image = request_schema.load(request.json)
                 if log.isEnabledFor(logging.DEBUG):
                     log.debug(gettext('Adding %s'), self.human_name)
@@ -119,7 +130,7 @@ class DeploymentImageDetailApi(Resource):
         if deployment_image is not None:
             result = {
                 'status': 'OK',
-                'data': [DeploymentImageItemResponseSchema().dump(
+                'data': [get_schema(DeploymentImageItemResponseSchema).dump(
                     deployment_image)]
             }
         else:
@@ -178,7 +189,7 @@ class DeploymentImageDetailApi(Resource):
                 DeploymentImageCreateRequestSchema)
             # Ignore missing fields to allow partial updates
             deployment_image = request_schema.load(request.json, partial=True)
-            response_schema = DeploymentImageItemResponseSchema()
+            response_schema = get_schema(DeploymentImageItemResponseSchema)
             try:
                 deployment_image.id = deployment_image_id
                 deployment_image = db.session.merge(deployment_image)
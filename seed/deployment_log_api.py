@@ -1,15 +1,18 @@
-import math
 import logging
 
 from seed.app_auth import requires_auth, requires_permission
 from flask import request, current_app, g as flask_globals
 from flask_restful import Resource
-from sqlalchemy import or_
+from sqlalchemy import func, or_
 from http import HTTPStatus
 from marshmallow.exceptions import ValidationError
 
+from seed.pagination import (COUNT_EXACT, get_count_strategy,
+                             get_page_size, keyset_paginate, paginate)
 from seed.schema import *
-from seed.util import translate_validation
+from seed.util import (conditional_headers, load_only_fields,
+                       ndjson_response, not_modified, translate_validation,
+                       wants_ndjson)
 from flask_babel import gettext
 
 log = logging.getLogger(__name__)
@@ -28,6 +31,8 @@ class DeploymentLogListApi(Resource):
         else:
             only = ('id', ) if request.args.get(
                 'simple', 'false') == 'true' else None
+        list_schema = get_schema(
+            DeploymentLogListResponseSchema, many=True, only=only)
         deployment_logs = DeploymentLog.query
 
         deployment_id = request.args.get('deployment')
@@ -35,36 +40,82 @@ class DeploymentLogListApi(Resource):
             deployment_logs = deployment_logs.filter(
                 DeploymentLog.deployment_id==deployment_id)
 
+        # Keyset pagination reads the sort value of the last row
+        keyset = 'cursor' in request.args
+        count = get_count_strategy(request.args.get('count'))
+
+        headers = {}
+        total = None
+        if not wants_ndjson():
+            # Conditional GET: validators are computed before reading rows.
+            # If an exact count is required, it is computed here too.
+            if count == COUNT_EXACT and not keyset:
+                last_modified, total = deployment_logs.with_entities(
+                    func.max(DeploymentLog.date),
+                    func.count(DeploymentLog.id)).one()
+                version = total
+            else:
+                last_modified, version = deployment_logs.with_entities(
+                    func.max(DeploymentLog.date),
+                    func.max(DeploymentLog.id)).one()
+            headers = conditional_headers(last_modified, version)
+            response = not_modified(headers)
+            if response is not None:
+                return response
+
         sort = request.args.get('sort', 'date')
-        if sort not in ['date']:
+        if sort not in ['date', 'id']:
             sort = 'date'
+        asc = request.args.get('asc', 'false') != 'false'
         sort_option = getattr(DeploymentLog, sort)
-        if request.args.get('asc', 'false') == 'false':
+        if not asc:
             sort_option = sort_option.desc()
         deployment_logs = deployment_logs.order_by(sort_option)
-
+        deployment_logs = load_only_fields(
+            deployment_logs, DeploymentLog, only,
+            extra=[sort] if keyset else None)
+
+        if wants_ndjson():
+            return ndjson_response(deployment_logs, get_schema(
+                DeploymentLogListResponseSchema, only=only))
+
+        page_size = get_page_size(request.args.get('size'))
+        if page_size is None:
+            return {'status': 'ERROR',
+                    'message': gettext('Invalid page size.')}, \
+                HTTPStatus.BAD_REQUEST
         page = request.args.get('page') or '1'
-        if page is not None and page.isdigit():
-            page_size = int(request.args.get('size', 20))
+        if keyset:
+            # Keyset pagination: no COUNT(*) and no OFFSET scan
+            try:
+                items, next_cursor = keyset_paginate(
+                    deployment_logs, getattr(DeploymentLog, sort),
+                    DeploymentLog.id, sort, asc, page_size,
+                    request.args.get('cursor'))
+            except ValueError:
+                return {'status': 'ERROR',
+                        'message': gettext('Invalid cursor.')}, \
+                    HTTPStatus.BAD_REQUEST
+            result = {
+                'data': list_schema.dump(items),
+                'pagination': {'size': page_size, 'next': next_cursor}
+            }
+        elif page is not None and page.isdigit():
             page = int(page)
-            pagination = deployment_logs.paginate(page, page_size, True)
+            items, pagination = paginate(
+                deployment_logs, page, page_size, count, total)
             result = {
-                'data': DeploymentLogListResponseSchema(
-                    many=True, only=only).dump(pagination.items),
-                'pagination': {
-                    'page': page, 'size': page_size,
-                    'total': pagination.total,
-                    'pages': int(math.ceil(1.0 * pagination.total / page_size))}
+                'data': list_schema.dump(items),
+                'pagination': pagination
             }
         else:
             result = {
-                'data': DeploymentLogListResponseSchema(
-                    many=True, only=only).dump(
+                'data': list_schema.dump(
                     deployment_logs)}
 
         if log.isEnabledFor(logging.DEBUG):
             log.debug(gettext('Listing %(name)s', name=self.human_name))
-        return result
+        return result, HTTPStatus.OK, headers
 
 
 class DeploymentLogDetailApi(Resource):
@@ -84,7 +135,7 @@ class DeploymentLogDetailApi(Resource):
         if deployment_log is not None:
             result = {
                 'status': 'OK',
-                'data': [DeploymentLogItemResponseSchema().dump(
+                'data': [get_schema(DeploymentLogItemResponseSchema).dump(
                     deployment_log)]
             }
         else:
@@ -1,4 +1,3 @@
-import math
 import logging
 
 from seed.app_auth import requires_auth, requires_permission
@@ -8,8 +7,10 @@ from sqlalchemy import or_
 from http import HTTPStatus
 from marshmallow.exceptions import ValidationError
 
+from seed.pagination import get_count_strategy, get_page_size, paginate
 from seed.schema import *
-from seed.util import translate_validation
+from seed.util import (load_only_fields, ndjson_response,
+                       translate_validation, wants_ndjson)
 from flask_babel import gettext
 
 log = logging.getLogger(__name__)
@@ -28,6 +29,9 @@ class DeploymentMetricListApi(Resource):
         else:
             only = ('id', ) if request.args.get(
                 'simple', 'false') == 'true' else None
+        list_schema = get_schema(
+            DeploymentMetricListResponseSchema, many=True, only=only)
+        count = get_count_strategy(request.args.get('count'))
         enabled_filter = request.args.get('enabled')
         if enabled_filter:
             deployment_metrics = DeploymentMetric.query.filter(
@@ -35,23 +39,30 @@ class DeploymentMetricListApi(Resource):
         else:
             deployment_metrics = DeploymentMetric.query
 
+        deployment_metrics = load_only_fields(
+            deployment_metrics, DeploymentMetric, only)
+
+        if wants_ndjson():
+            return ndjson_response(deployment_metrics, get_schema(
+                DeploymentMetricListResponseSchema, only=only))
+
+        page_size = get_page_size(request.args.get('size'))
+        if page_size is None:
+            return {'status': 'ERROR',
+                    'message': gettext('Invalid page size.')}, \
+                HTTPStatus.BAD_REQUEST
         page = request.args.get('page') or '1'
         if page is not None and page.isdigit():
-            page_size = int(request.args.get('size', 20))
             page = int(page)
-            pagination = deployment_metrics.paginate(page, page_size, True)
+            items, pagination = paginate(
+                deployment_metrics, page, page_size, count)
             result = {
-                'data': DeploymentMetricListResponseSchema(
-                    many=True, only=only).dump(pagination.items),
-                'pagination': {
-                    'page': page, 'size': page_size,
-                    'total': pagination.total,
-                    'pages': int(math.ceil(1.0 * pagination.total / page_size))}
+                'data': list_schema.dump(items),
+                'pagination': pagination
             }
         else:
             result = {
-                'data': DeploymentMetricListResponseSchema(
-                    many=True, only=only).dump(
+                'data': list_schema.dump(
                     deployment_metrics)}
 
         if log.isEnabledFor(logging.DEBUG):
@@ -66,7 +77,7 @@ class DeploymentMetricListApi(Resource):
         
         if request.json is not None:
             request_schema = DeploymentMetricCreateRequestSchema()
-            response_schema = DeploymentMetricItemResponseSchema()
+            response_schema = get_schema(DeploymentMetricItemResponseSchema)
             deployment_metric = request_schema.load(request.json)
             try:
                 if log.isEnabledFor(logging.DEBUG):
@@ -113,7 +124,7 @@ class DeploymentMetricDetailApi(Resource):
         if deployment_metric is not None:
             result = {
                 'status': 'OK',
-                'data': [DeploymentMetricItemResponseSchema().dump(
+                'data': [get_schema(DeploymentMetricItemResponseSchema).dump(
                     deployment_metric)]
             }
         else:
@@ -172,7 +183,7 @@ class DeploymentMetricDetailApi(Resource):
                 DeploymentMetricCreateRequestSchema)
             # Ignore missing fields to allow partial updates
             deployment_metric = request_schema.load(request.json, partial=True)
-            response_schema = DeploymentMetricItemResponseSchema()
+            response_schema = get_schema(DeploymentMetricItemResponseSchema)
             try:
                 deployment_metric.id = deployment_metric_id
                 deployment_metric = db.session.merge(deployment_metric)
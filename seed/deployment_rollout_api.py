@@ -0,0 +1,67 @@
+import logging
+from http import HTTPStatus
+
+from seed.app_auth import requires_auth
+from flask import request
+from flask_restful import Resource
+
+from seed.pagination import get_count_strategy, get_page_size, paginate
+from seed.schema import *
+from seed.util import load_only_fields, ndjson_response, wants_ndjson
+from flask_babel import gettext
+
+log = logging.getLogger(__name__)
+
+
+class DeploymentRolloutListApi(Resource):
+    """ REST API for listing class DeploymentRollout (time to ready of
+    deployments, see seed.rollouts) """
+
+    def __init__(self):
+        self.human_name = gettext('DeploymentRollout')
+
+    @requires_auth
+    def get(self):
+        if request.args.get('fields'):
+            only = [f.strip() for f in request.args.get('fields').split(',')]
+        else:
+            only = None
+        list_schema = get_schema(
+            DeploymentRolloutListResponseSchema, many=True, only=only)
+        count = get_count_strategy(request.args.get('count'))
+        deployment_rollouts = DeploymentRollout.query
+
+        deployment_id = request.args.get('deployment')
+        if deployment_id:
+            deployment_rollouts = deployment_rollouts.filter(
+                DeploymentRollout.deployment_id == deployment_id)
+        deployment_rollouts = load_only_fields(
+            deployment_rollouts, DeploymentRollout, only).order_by(
+                DeploymentRollout.started.desc())
+
+        if wants_ndjson():
+            return ndjson_response(deployment_rollouts, get_schema(
+                DeploymentRolloutListResponseSchema, only=only))
+
+        page_size = get_page_size(request.args.get('size'))
+        if page_size is None:
+            return {'status': 'ERROR',
+                    'message': gettext('Invalid page size.')}, \
+                HTTPStatus.BAD_REQUEST
+        page = request.args.get('page') or '1'
+        if page is not None and page.isdigit():
+            page = int(page)
+            items, pagination = paginate(
+                deployment_rollouts, page, page_size, count)
+            result = {
+                'data': list_schema.dump(items),
+                'pagination': pagination
+            }
+        else:
+            result = {
+                'data': list_schema.dump(
+                    deployment_rollouts)}
+
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug(gettext('Listing %(name)s', name=self.human_name))
+        return result
@@ -1,4 +1,3 @@
-import math
 import logging
 
 from seed.app_auth import requires_auth, requires_permission
@@ -8,8 +7,13 @@ from sqlalchemy import or_
 from http import HTTPStatus
 from marshmallow.exceptions import ValidationError
 
+from seed import rq
+from seed.jobs import invalidate_api_client
+from seed.scheduling import queue_stats
+from seed.pagination import get_count_strategy, get_page_size, paginate
 from seed.schema import *
-from seed.util import translate_validation
+from seed.util import (load_only_fields, ndjson_response,
+                       translate_validation, wants_ndjson)
 from flask_babel import gettext
 
 log = logging.getLogger(__name__)
@@ -28,6 +32,9 @@ class DeploymentTargetListApi(Resource):
         else:
             only = ('id', ) if request.args.get(
                 'simple', 'false') == 'true' else None
+        list_schema = get_schema(
+            DeploymentTargetListResponseSchema, many=True, only=only)
+        count = get_count_strategy(request.args.get('count'))
         enabled_filter = request.args.get('enabled')
         if enabled_filter:
             deployment_targets = DeploymentTarget.query.filter(
@@ -35,23 +42,30 @@ class DeploymentTargetListApi(Resource):
         else:
             deployment_targets = DeploymentTarget.query
 
+        deployment_targets = load_only_fields(
+            deployment_targets, DeploymentTarget, only)
+
+        if wants_ndjson():
+            return ndjson_response(deployment_targets, get_schema(
+                DeploymentTargetListResponseSchema, only=only))
+
+        page_size = get_page_size(request.args.get('size'))
+        if page_size is None:
+            return {'status': 'ERROR',
+                    'message': gettext('Invalid page size.')}, \
+                HTTPStatus.BAD_REQUEST
         page = request.args.get('page') or '1'
         if page is not None and page.isdigit():
-            page_size = int(request.args.get('size', 20))
             page = int(page)
-            pagination = deployment_targets.paginate(page, page_size, True)
+            items, pagination = paginate(
+                deployment_targets, page, page_size, count)
             result = {
-                'data': DeploymentTargetListResponseSchema(
-                    many=True, only=only).dump(pagination.items),
-                'pagination': {
-                    'page': page, 'size': page_size,
-                    'total': pagination.total,
-                    'pages': int(math.ceil(1.0 * pagination.total / page_size))}
+                'data': list_schema.dump(items),
+                'pagination': pagination
             }
         else:
             result = {
-                'data': DeploymentTargetListResponseSchema(
-                    many=True, only=only).dump(
+                'data': list_schema.dump(
                     deployment_targets)}
 
         if log.isEnabledFor(logging.DEBUG):
@@ -66,7 +80,7 @@ class DeploymentTargetListApi(Resource):
 
         if request.json is not None:
             request_schema = DeploymentTargetCreateRequestSchema()
-            response_schema = DeploymentTargetItemResponseSchema()
+            response_schema = get_schema(DeploymentTargetItemResponseSchema)
             deployment_target = request_schema.load(request.json)
             try:
                 if log.isEnabledFor(logging.DEBUG):
@@ -114,7 +128,7 @@ class DeploymentTargetDetailApi(Resource):
         if deployment_target is not None:
             result = {
                 'status': 'OK',
-                'data': [DeploymentTargetItemResponseSchema().dump(
+                'data': [get_schema(DeploymentTargetItemResponseSchema).dump(
                     deployment_target)]
             }
         else:
@@ -139,6 +153,7 @@ class DeploymentTargetDetailApi(Resource):
             try:
                 db.session.delete(deployment_target)
                 db.session.commit()
+                invalidate_api_client(deployment_target_id)
                 result = {
                     'status': 'OK',
                     'message': gettext('%(name)s deleted with success!',
@@ -173,11 +188,12 @@ class DeploymentTargetDetailApi(Resource):
                 DeploymentTargetCreateRequestSchema)
             # Ignore missing fields to allow partial updates
             deployment_target = request_schema.load(request.json, partial=True)
-            response_schema = DeploymentTargetItemResponseSchema()
+            response_schema = get_schema(DeploymentTargetItemResponseSchema)
             try:
                 deployment_target.id = deployment_target_id
                 deployment_target = db.session.merge(deployment_target)
                 db.session.commit()
+                invalidate_api_client(deployment_target_id)
 
                 if deployment_target is not None:
                     return_code = HTTPStatus.OK
@@ -206,3 +222,13 @@ class DeploymentTargetDetailApi(Resource):
                     result['debug_detail'] = str(e)
                 db.session.rollback()
         return result, return_code
+
+
+class DeploymentTargetQueueListApi(Resource):
+    """ REST API for the job queues of deployment targets """
+
+    @requires_auth
+    def get(self):
+        """Depth, running jobs and wait time (seconds) of the oldest queued
+        job, per target queue. See seed.scheduling."""
+        return {'status': 'OK', 'data': queue_stats(rq.connection)}
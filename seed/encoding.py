@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+import decimal
+import gzip
+import json
+
+from flask import current_app, make_response, request
+from flask.json import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+JSON_BACKEND_STDLIB = 'json'
+JSON_BACKEND_ORJSON = 'orjson'
+
+# Responses smaller than this (in bytes) are not compressed
+COMPRESSION_MIN_SIZE = 1024
+COMPRESSION_MIMETYPES = ('application/json', 'application/x-ndjson')
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+
+
+class JsonEncoder(JSONEncoder):
+    def default(self, obj):
+        if isinstance(obj, decimal.Decimal):
+            return float(obj)
+        return JSONEncoder.default(self, obj)
+
+
+def _default(obj):
+    """ Types not natively supported by orjson """
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    raise TypeError(f'Type is not JSON serializable: {type(obj).__name__}')
+
+
+def dumps(data, indent: bool = False) -> bytes:
+    """Serializes data to JSON using the backend configured in JSON_BACKEND.
+    orjson encodes datetime natively and is used if it is installed, unless
+    JSON_BACKEND is 'json'. The standard library backend uses the same
+    settings as Flask-RESTful (RESTFUL_JSON).
+    """
+    backend = current_app.config.get('JSON_BACKEND', JSON_BACKEND_ORJSON)
+    if backend == JSON_BACKEND_ORJSON and orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, default=_default, option=option)
+
+    settings = dict(current_app.config.get('RESTFUL_JSON', {}))
+    if indent:
+        settings.setdefault('indent', 4)
+    return json.dumps(data, **settings).encode('utf8')
+
+
+def output_json(data, code, headers=None):
+    """Flask-RESTful representation for application/json"""
+    resp = make_response(dumps(data, indent=current_app.debug) + b'\n', code)
+    resp.headers.extend(headers or {})
+    return resp
+
+
+def compress_response(response):
+    """Compresses (brotli or gzip, as negotiated with the client) JSON
+    responses larger than COMPRESSION_MIN_SIZE. Streamed responses are kept
+    uncompressed.
+    """
+    if (response.mimetype not in COMPRESSION_MIMETYPES
+            or not 200 <= response.status_code < 300
+            or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    min_size = current_app.config.get('COMPRESSION_MIN_SIZE',
+                                      COMPRESSION_MIN_SIZE)
+    if len(data) < min_size:
+        return response
+
+    supported = ['br', 'gzip'] if brotli is not None else ['gzip']
+    encoding = request.accept_encodings.best_match(supported)
+    if encoding == 'br':
+        data = brotli.compress(data, quality=BROTLI_QUALITY)
+    elif encoding == 'gzip':
+        data = gzip.compress(data, compresslevel=GZIP_LEVEL)
+    else:
+        return response
+
+    response.set_data(data)
+    response.headers['Content-Encoding'] = encoding
+    # Representation changed, so a strong validator is no longer valid
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
@@ -1,22 +1,38 @@
 # coding=utf-8
-import requests
+import datetime
+import email.utils
+import hashlib
 import json
 import logging.config
 import os
+import random
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from shutil import copyfile
-from typing import Callable
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 from flask import current_app
-from flask_babel import force_locale
-from flask_babel import gettext as babel_gettext
 from kubernetes import client, config
 from kubernetes.client import ApiClient
 from kubernetes.client.api.apps_v1_api import AppsV1Api
 from kubernetes.client.exceptions import ApiException
-
-from seed import rq
-from seed.k8s_crud import create_deployment, delete_deployment
+from rq import get_current_job
+from sqlalchemy import inspect
+from sqlalchemy.orm import joinedload
+import urllib3
+
+from seed import node_ports, rollouts, rq, scheduling
+from seed.notifier import notifier
+from seed.translations import get_gettext
+from seed.k8s_crud import (CountingApiClient, api_calls, create_deployment,
+                           delete_deployment, get_node_ports,
+                           list_deployments, model_urls, read_deployment,
+                           rollout_status, rollout_version)
 from seed.models import (Deployment, DeploymentLog,
                          DeploymentStatus, DeploymentTarget,
                          DeploymentTargetType, db)
@@ -25,32 +41,49 @@ from seed.util import get_internal_name
 logging.config.fileConfig('logging_config.ini')
 logger = logging.getLogger(__name__)
 
+# Threads calling the Kubernetes API in a bulk deploy (per target)
+BULK_DEPLOY_WORKERS = 8
+# Deployments whose status is committed together in a bulk deploy
+BULK_COMMIT_SIZE = 100
+# Maximum wait (seconds) for UI events to be sent when a job finishes
+NOTIFY_FLUSH_TIMEOUT = 2
+# Kubernetes API errors (HTTP status) that may succeed if the job runs again
+TRANSIENT_STATUSES = (429, 500, 502, 503, 504)
+# Attempts of a scheduled deploy/undeploy (see Deployment.attempts) and
+# delay (seconds) between them: exponential backoff, with jitter
+MAX_ATTEMPTS = 5
+RETRY_BASE_DELAY = 2
+RETRY_MAX_DELAY = 300
+# Interval (seconds) to load node ports in use in the cluster of a target
+# into the allocation table (see node_ports.reconcile)
+NODE_PORTS_RECONCILE_INTERVAL = 3600
+
+# Process that imported this module (RQ worker). Jobs run in this process
+# with scheduling.TargetWorker, or in forked processes with RQ's Worker
+_worker_pid = os.getpid()
 
-def ctx_gettext(locale: str):
-    def translate(msg, **variables):
-        from seed.app import app
-        with app.test_request_context():
-            with force_locale(locale):
-                return babel_gettext(msg, **variables)
 
-    return translate
+def ctx_gettext(locale: str):
+    """Returns gettext for the locale. Translations are loaded once per
+    locale and used without a Flask request context."""
+    return get_gettext(locale)
 
 
 def _notify_ui(**data):
-    services = current_app.config['SEED_CONFIG']['services']
-    print('-' * 20)
-    if 'stand' in services:
-        stand = services.get('stand')
-        try:
-            resp = requests.post(
-                f'{stand.get("url")}/room', data=json.dumps(data),
-                headers={'X-Auth-Token': str(stand.get('auth_token')),
-                         'Content-type': 'application/json'})
-            print(resp.text)
-        except Exception as e:
-            print(e)
-            pass
-    print('-' * 20)
+    """Sends the event to the UI asynchronously (see seed.notifier)"""
+    notifier.notify(**data)
+    if os.getpid() != _worker_pid:
+        # A forked work horse exits right after the job, so the events are
+        # sent before
+        flush_ui_events()
+
+
+def flush_ui_events() -> None:
+    """Waits (a limited time) for pending UI events to be sent"""
+    timeout = current_app.config.get('NOTIFY_FLUSH_TIMEOUT',
+                                     NOTIFY_FLUSH_TIMEOUT)
+    if not notifier.flush(timeout):
+        logger.warning('Events not sent to UI: %s', notifier.stats())
 
 
 @rq.exception_handler
@@ -58,13 +91,32 @@ def report_jobs_errors(job, *exc_info):
     logger.error('ERROR', exc_info[0])
 
 
+def _report_api_calls(deployment_id: int) -> None:
+    """Logs the Kubernetes API calls made by the job and stores them in the
+    job metadata (key k8s_api_calls), with the model URL cache counters
+    (key model_url_cache)"""
+    calls = api_calls.reset()
+    cache = model_urls.stats()
+    logger.info('Kubernetes API calls for deployment %s: %s (model URL '
+                'cache: %s)', deployment_id, calls, cache)
+    job = get_current_job()
+    if job is not None:
+        job.meta['k8s_api_calls'] = calls
+        job.meta['model_url_cache'] = cache
+        job.save_meta()
+
+
 @rq.job('seed')
-def deploy(deployment_id: int, locale: str, user_id: int) -> None:
+def deploy(deployment_id: int, locale: str, user_id: int,
+           version: Optional[int] = None) -> None:
 
+    api_calls.reset()
     gettext = ctx_gettext(locale)
     deployment = None
     try:
         deployment = Deployment.query.get(deployment_id)
+        if _is_superseded(deployment, version):
+            return
         if deployment:
             deployment_image = deployment.image
             deployment_target = deployment.target
@@ -81,7 +133,9 @@ def deploy(deployment_id: int, locale: str, user_id: int) -> None:
                     gettext('Deployment target %(type)s not supported',
                             deployment_target.type))
 
-            api_apps = _get_api(deployment_target, gettext)
+            api_apps = get_api(deployment_target, gettext)
+            _reconcile_node_ports(deployment_target, api_apps)
+            deployment.port = node_ports.allocate(deployment)
 
             create_deployment(deployment, deployment_image,
                               deployment_target, api_apps)
@@ -94,46 +148,262 @@ def deploy(deployment_id: int, locale: str, user_id: int) -> None:
             #         dst = volume_path + os.path.basename(f)
             #         copyfile(f, dst)
 
-            deployment.current_status = DeploymentStatus.DEPLOYED
+            # Status changes when the rollout finishes (track_rollouts)
+            log_message = _start_rollout(deployment, gettext)
             db.session.add(deployment)
-
-            log_message = gettext(
-                'Successfully deployed as a service (port={}'.format(
-                    deployment.port))
             _log_message_for_deployment(deployment_id, log_message,
-                                        status=DeploymentStatus.DEPLOYED)
-            db.session.commit()
+                                        status=deployment.current_status)
+            _track_rollouts(deployment_target.id,
+                            {deployment.id: deployment.version},
+                            locale, user_id)
         else:
             log_message = gettext(
                 'Deployment information with id=%(id)s not found',
                 id=deployment_id)
             logger.warn(log_message)
 
-    except ApiException as e:
-        if e.status in (404, 409):
-            status = json.loads(e.body)
-            msg = {
-                404: '%(kind)s %(name)s not found.',
-                409: '%(kind)s %(name)s already exists.',
-            }
-            name = status.get('details', {}).get('name')
-            kind = status.get('details', {}).get('kind', " ")[:-1]
-            log_message = gettext(msg[e.status], kind=kind, name=name)
-        else:
-            log_message = gettext('Error in deployment: %(error)s',
-                                  error=str(e))
-        _log_exception(log_message, deployment, e)
     except Exception as e:
-        log_message = gettext('Error in deployment: %(error)s', error=str(e))
-        _log_exception(log_message, deployment, e)
+        if not _retry_later(deployment, e, deploy, locale, user_id,
+                            gettext):
+            _log_exception(_error_message(e, gettext), deployment, e)
     finally:
+        _report_api_calls(deployment_id)
         _notify_ui(event='refresh', room=f'deployment.list.{user_id}',
                    data={}, namespace='/stand')
 
 
-def _get_api(deployment_target: DeploymentTarget,
+@rq.job('seed')
+def deploy_many(deployment_ids: List[int], locale: str, user_id: int,
+                versions: Optional[Dict[int, int]] = None) -> Dict[str, Any]:
+    """Deploys many deployments in a single job. Deployments are grouped by
+    target, so the API client and node port reconciliation are shared, and
+    the Kubernetes calls run in a bounded thread pool
+    (BULK_DEPLOY_WORKERS). The bulk deploy API enqueues one job per target,
+    in the queue of the target (see seed.scheduling). Status and logs are committed in batches.
+    Deployments whose version is not the one in versions were scheduled
+    again by a newer job and are skipped. Deployments that fail with a
+    transient error are retried later by single deploy jobs.
+
+    Returns:
+        dict: Number of deployed, failed, retried and skipped deployments,
+            elapsed time and throughput (deployments/sec)
+    """
+    api_calls.reset()
+    gettext = ctx_gettext(locale)
+    start = time.monotonic()
+    deployed = errors = retried = skipped = 0
+    versions = versions or {}
+    try:
+        deployments = Deployment.query.options(
+            joinedload(Deployment.target), joinedload(Deployment.image)
+        ).filter(Deployment.id.in_(deployment_ids)).all()
+        by_target = defaultdict(list)
+        for deployment in deployments:
+            if _is_superseded(deployment, versions.get(deployment.id)):
+                skipped += 1
+                continue
+            by_target[deployment.target_id].append(deployment)
+
+        app = current_app._get_current_object()
+        max_workers = current_app.config.get('BULK_DEPLOY_WORKERS',
+                                             BULK_DEPLOY_WORKERS)
+        for target_deployments in by_target.values():
+            ok, failed, retry = _deploy_target(
+                app, target_deployments, max_workers, locale, user_id,
+                gettext)
+            deployed += ok
+            errors += failed
+            retried += retry
+    finally:
+        _report_api_calls(f'bulk of {len(deployment_ids)}')
+        _notify_ui(event='refresh', room=f'deployment.list.{user_id}',
+                   data={}, namespace='/stand')
+
+    elapsed = time.monotonic() - start
+    result = {'total': len(deployment_ids), 'deployed': deployed,
+              'errors': errors, 'retried': retried, 'skipped': skipped,
+              'elapsed': round(elapsed, 3),
+              'throughput': round(deployed / elapsed, 2) if elapsed else 0}
+    logger.info('Bulk deploy finished: %s', result)
+    return result
+
+
+def _deploy_target(app, deployments: List[Deployment], max_workers: int,
+                   locale: str, user_id: int,
+                   gettext: Callable) -> Tuple[int, int, int]:
+    """Deploys deployments that share the same target. Database access is
+    done in the calling thread; pool threads only call the Kubernetes API.
+
+    Returns:
+        tuple: Number of deployed, failed and retried deployments
+    """
+    deployment_target = deployments[0].target
+    failures = {}
+    try:
+        if deployment_target.target_type != DeploymentTargetType.KUBERNETES:
+            raise ValueError(
+                gettext('Deployment target %(type)s not supported',
+                        type=deployment_target.target_type))
+        api_apps = get_api(deployment_target, gettext)
+        _reconcile_node_ports(deployment_target, api_apps)
+    except Exception as e:
+        failures = {d.id: e for d in deployments}
+
+    to_deploy = []
+    for deployment in deployments:
+        if deployment.id in failures:
+            continue
+        try:
+            deployment.internal_name = get_internal_name(deployment)
+            deployment.base_service_url = deployment_target.base_service_url
+            deployment.port = node_ports.allocate(deployment)
+            to_deploy.append(deployment)
+        except Exception as e:
+            db.session.rollback()
+            failures[deployment.id] = e
+
+    # Allocation commits (expiring attributes), so deployments are loaded
+    # again, in one query, before they are read by other threads
+    if to_deploy:
+        Deployment.query.options(
+            joinedload(Deployment.target), joinedload(Deployment.image)
+        ).filter(Deployment.id.in_([d.id for d in to_deploy])).all()
+        deployment_target = to_deploy[0].target
+
+    # Model URLs are resolved together (and cached) before the pool starts
+    try:
+        model_urls.resolve_many([d.model_id for d in to_deploy], max_workers)
+    except Exception as e:
+        logger.warning('Unable to resolve model URLs in bulk: %s', e)
+
+    # Pool threads receive copies of the models, detached from the session
+    target_copy = _copy_model(deployment_target)
+
+    def run(deployment, image):
+        with app.app_context():
+            create_deployment(deployment, image, target_copy, api_apps)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(run, _copy_model(d),
+                                   _copy_model(d.image)): d
+                   for d in to_deploy}
+        for future in as_completed(futures):
+            e = future.exception()
+            if e is not None:
+                failures[futures[future].id] = e
+
+    retried = 0
+    for i, deployment in enumerate(deployments, 1):
+        e = failures.get(deployment.id)
+        if e is None:
+            log_message = _start_rollout(deployment, gettext)
+        elif _retry_later(deployment, e, deploy, locale, user_id, gettext):
+            retried += 1
+            continue
+        else:
+            logger.error('Running job for deployment %s: %s',
+                         deployment.id, e)
+            deployment.current_status = DeploymentStatus.ERROR
+            log_message = _error_message(e, gettext)
+        db.session.add(DeploymentLog(status=deployment.current_status,
+                                     deployment_id=deployment.id,
+                                     log=log_message))
+        if i % BULK_COMMIT_SIZE == 0:
+            db.session.commit()
+    db.session.commit()
+    _track_rollouts(deployment_target.id,
+                    {d.id: d.version for d in deployments
+                     if d.id not in failures}, locale, user_id)
+    return (len(deployments) - len(failures), len(failures) - retried,
+            retried)
+
+
+def _copy_model(instance) -> SimpleNamespace:
+    """Copy of the column attributes of a model instance, to be read by
+    other threads without using the database session"""
+    return SimpleNamespace(**{
+        attr.key: getattr(instance, attr.key)
+        for attr in inspect(instance).mapper.column_attrs})
+
+
+# Kubernetes API clients, shared by jobs running in this process. Each client
+# keeps its own configuration and HTTP connection pool.
+_api_clients: Dict[Tuple, ApiClient] = {}
+_api_clients_lock = threading.RLock()
+
+
+def _new_kube_config_client() -> ApiClient:
+    configuration = client.Configuration()
+    config.load_kube_config(client_configuration=configuration,
+                            persist_config=False)
+    return CountingApiClient(configuration)
+
+
+def _new_in_cluster_client() -> ApiClient:
+    configuration = client.Configuration()
+    config.load_incluster_config(client_configuration=configuration)
+    return CountingApiClient(configuration)
+
+
+def _new_token_client(url: str, auth_info: str) -> ApiClient:
+    configuration = client.Configuration()
+    configuration.verify_ssl = False
+    configuration.debug = False
+    token = json.loads(auth_info).get('token')
+    configuration.api_key["authorization"] = f"Bearer {token}"
+    configuration.host = url
+    return CountingApiClient(configuration)
+
+
+def _get_api_client(key: Tuple, factory: Callable[[], ApiClient]) -> ApiClient:
+    """Returns the cached API client for key, creating it if needed.
+    The first element of key identifies the target, so a client created with
+    outdated credentials is discarded when the target changes.
+    """
+    with _api_clients_lock:
+        api_client = _api_clients.get(key)
+        if api_client is None:
+            invalidate_api_client(key[0])
+            api_client = factory()
+            _api_clients[key] = api_client
+        return api_client
+
+
+def invalidate_api_client(target_id: Any) -> None:
+    """Removes cached API clients for a deployment target, in this process.
+    Other processes (workers) do not use outdated credentials either,
+    because clients are cached by a hash of the URL and authentication of
+    the target (see get_api), and a new client discards the old ones.
+    """
+    with _api_clients_lock:
+        for key in [k for k in _api_clients if k[0] == target_id]:
+            del _api_clients[key]
+
+
+def _reconcile_node_ports(deployment_target: DeploymentTarget,
+                          api: AppsV1Api) -> None:
+    """Loads the node ports in use in the cluster into the allocation table,
+    at most once every NODE_PORTS_RECONCILE_INTERVAL seconds per target, by
+    any worker: a marker with this expiration is kept in Redis after a
+    reconciliation. Meanwhile, ports are allocated without listing the
+    services of the cluster.
+    """
+    key = f'seed:target:{deployment_target.id}:node-ports-reconciled'
+    if rq.connection.exists(key):
+        return
+    changed = node_ports.reconcile(deployment_target.id, get_node_ports(api))
+    rq.connection.set(key, 1, ex=current_app.config.get(
+        'NODE_PORTS_RECONCILE_INTERVAL', NODE_PORTS_RECONCILE_INTERVAL))
+    logger.info('Node ports reconciled for target %s (%s changes)',
+                deployment_target.id, changed)
+
+
+def get_api(deployment_target: DeploymentTarget,
              gettext: Callable) -> AppsV1Api:
-    """Returns API to connect to Kuberntes
+    """Returns API to connect to Kuberntes. The underlying API client
+    (configuration and connection pool) is cached per process, so it is
+    reused by all jobs run by a worker (scheduling.TargetWorker does not
+    fork), by the reconciler and by the threads of bulk deploys.
 
     Args:
         deployment_target (DeploymentTarget): Deployment information
@@ -141,38 +411,51 @@ def _get_api(deployment_target: DeploymentTarget,
     Returns:
         AppsV1Api: Kubernetes api
     """
+    # Clients are cached per target, because each one has the rate limiter
+    # of its target
     if os.path.exists(os.path.join(Path.home(), '.kube', 'config')):
         # Use local configuration, present in ~/.kube/config
-        config.load_kube_config()
-        api_apps = client.AppsV1Api()
+        api_client = _get_api_client((deployment_target.id, 'kube_config'),
+                                     _new_kube_config_client)
     elif 'KUBERNETES_SERVICE_HOST' in os.environ:
         # Seed is running inside kubernetes.
-        config.load_incluster_config()
-        api_apps = client.AppsV1Api()
+        api_client = _get_api_client((deployment_target.id, 'in_cluster'),
+                                     _new_in_cluster_client)
     else:
         # Use auth and url present in the target to connect to the API
-        configuration = client.Configuration()
-        configuration.verify_ssl = False
-        configuration.debug = False
         auth_info = deployment_target.authentication_info
         if auth_info is None:
             raise ValueError(gettext(
                 'No authentication info configured in deployment target'))
-        token = json.loads(auth_info).get('token')
-        configuration.api_key["authorization"] = f"Bearer {token}"
-        configuration.host = deployment_target.url
-        api_apps = client.AppsV1Api(ApiClient(configuration))
-    return api_apps
+        credentials = hashlib.sha256(
+            f'{deployment_target.url}|{auth_info}'.encode('utf8')).hexdigest()
+        api_client = _get_api_client(
+            (deployment_target.id, credentials),
+            lambda: _new_token_client(deployment_target.url, auth_info))
+
+    if api_client.rate_limiter is None:
+        api_client.rate_limiter = scheduling.ApiRateLimiter(
+            deployment_target.id)
+    # Limit may change without invalidating the client
+    api_client.rate_limiter.rate = deployment_target.api_rate_limit
+    if api_client.rate_limiter.rate is None:
+        api_client.rate_limiter.rate = current_app.config.get(
+            'TARGET_API_RATE_LIMIT', scheduling.API_RATE_LIMIT)
+    return client.AppsV1Api(api_client)
 
 
 @rq.job('seed')
-def undeploy(deployment_id: int, locale: str, user_id: int) -> None:
+def undeploy(deployment_id: int, locale: str, user_id: int,
+             version: Optional[int] = None) -> None:
     # noinspection PyBroadException
 
+    api_calls.reset()
     gettext = ctx_gettext(locale)
     deployment = None
     try:
         deployment = Deployment.query.get(deployment_id)
+        if _is_superseded(deployment, version):
+            return
         deployment_target = deployment.target
 
         if deployment and deployment_target:
@@ -180,12 +463,13 @@ def undeploy(deployment_id: int, locale: str, user_id: int) -> None:
                 logger.info('Running job for deployment %s', deployment_id)
 
             # Kubernetes
-            api_apps = _get_api(deployment_target, gettext)
+            api_apps = get_api(deployment_target, gettext)
 
             delete_deployment(deployment, deployment_target, api_apps)
 
             deployment.current_status = DeploymentStatus.SUSPENDED
             db.session.add(deployment)
+            node_ports.release(deployment.id)
             db.session.commit()
             # Delete files of the volume path
             # volume_path = deployment_target.volume_path
@@ -211,6 +495,7 @@ def undeploy(deployment_id: int, locale: str, user_id: int) -> None:
 
             deployment.current_status = DeploymentStatus.SUSPENDED
             db.session.add(deployment)
+            node_ports.release(deployment.id)
             db.session.commit()
 
             name = status.get('details', {}).get('name')
@@ -218,11 +503,14 @@ def undeploy(deployment_id: int, locale: str, user_id: int) -> None:
             log_message = gettext(msg, kind=kind, name=name)
             _log_message_for_deployment(deployment_id, log_message,
                                         status=DeploymentStatus.SUSPENDED)
-        else:
+        elif not _retry_later(deployment, e, undeploy, locale, user_id,
+                              gettext):
             log_message = gettext('Error in deployment: %(error)s',
                                   error=str(e))
             _log_exception(log_message, deployment, e)
     except Exception as e:
+        if _retry_later(deployment, e, undeploy, locale, user_id, gettext):
+            return
         logger.exception('Running job for deployment %s')
         log_message = gettext('Error in deployment: {}'.format(e))
         if deployment:
@@ -231,6 +519,7 @@ def undeploy(deployment_id: int, locale: str, user_id: int) -> None:
         _log_message_for_deployment(deployment_id, log_message,
                                     status=DeploymentStatus.ERROR)
     finally:
+        _report_api_calls(deployment_id)
         _notify_ui(event='refresh', room=f'deployment.list.{user_id}',
                    data={}, namespace='/stand')
 
@@ -281,6 +570,230 @@ def undeploy(deployment_id: int, locale: str, user_id: int) -> None:
 #                                    status=DeploymentStatus.ERROR)
 
 
+def _is_superseded(deployment: Optional[Deployment],
+                   version: Optional[int]) -> bool:
+    """A job is superseded if the deployment was scheduled again (its
+    version changed) after the job was enqueued. Jobs enqueued without
+    a version are never superseded."""
+    if deployment is None or version is None or \
+            deployment.version == version:
+        return False
+    logger.info('Skipping job for deployment %s: version %s superseded '
+                'by %s', deployment.id, version, deployment.version)
+    return True
+
+
+@rq.job('seed')
+def track_rollouts(target_id: int, versions: Dict[int, int], locale: str,
+                   user_id: int, check: int = 1) -> Dict[str, int]:
+    """Checks, with a single call to the Kubernetes API, the rollouts
+    started by deploy jobs in a target. While rollouts are in progress and
+    their deadline did not pass, the job schedules itself again, so workers
+    do not wait for rollouts. Rollouts finished meanwhile (e.g. by the
+    reconciler) or superseded by a newer version are ignored.
+
+    Returns:
+        dict: Number of ready, failed and pending rollouts
+    """
+    gettext = ctx_gettext(locale)
+    deadline = current_app.config.get('ROLLOUT_DEADLINE',
+                                      rollouts.ROLLOUT_DEADLINE)
+    result = {'ready': 0, 'failed': 0, 'pending': 0}
+    deployment_target = DeploymentTarget.query.get(target_id)
+    open_rollouts = rollouts.get_open(list(versions))
+    deployments = []
+    for deployment in Deployment.query.filter(
+            Deployment.id.in_(list(versions))):
+        rollout = open_rollouts.get(deployment.id)
+        if (rollout is not None and rollout.version == versions[deployment.id]
+                and not _is_superseded(deployment, versions[deployment.id])):
+            deployments.append(deployment)
+    if not deployments or deployment_target is None:
+        return result
+
+    try:
+        api = get_api(deployment_target, gettext)
+        if len(deployments) == 1:
+            items = [read_deployment(deployments[0].internal_name,
+                                     deployment_target.namespace, api)]
+        else:
+            items = list_deployments(deployment_target.namespace, api)
+        k8s_deployments = {i.metadata.name: i for i in items if i}
+    except Exception as e:
+        # Checked again later, until the deadline
+        logger.warning('Unable to check rollouts in target %s: %s',
+                       target_id, e)
+        k8s_deployments = None
+
+    pending = {}
+    for deployment in deployments:
+        rollout = open_rollouts[deployment.id]
+        status, message = DeploymentStatus.PENDING, None
+        if k8s_deployments is not None:
+            k8s_deployment = k8s_deployments.get(deployment.internal_name)
+            if k8s_deployment is None:
+                status, message = DeploymentStatus.ERROR, gettext(
+                    'Deployment not found in the cluster.')
+            elif rollout_version(k8s_deployment) == rollout.version:
+                status, message = rollout_status(k8s_deployment, gettext)
+        if (status == DeploymentStatus.PENDING
+                and rollouts.is_expired(rollout, deadline)):
+            status, message = DeploymentStatus.ERROR, gettext(
+                'Replicas not available after %(seconds)s seconds.',
+                seconds=deadline)
+        if status == DeploymentStatus.PENDING:
+            pending[deployment.id] = rollout.version
+            continue
+
+        rollouts.finish(rollout, status)
+        if status == DeploymentStatus.DEPLOYED:
+            result['ready'] += 1
+            message = gettext(
+                'Deployed as a service (port=%(port)s), ready in '
+                '%(seconds)s seconds. %(message)s', port=deployment.port,
+                seconds=rollout.time_to_ready, message=message)
+        else:
+            result['failed'] += 1
+        deployment.current_status = status
+        db.session.add(DeploymentLog(status=status,
+                                     deployment_id=deployment.id,
+                                     log=message))
+    db.session.commit()
+
+    result['pending'] = len(pending)
+    _track_rollouts(target_id, pending, locale, user_id, check + 1)
+    if result['ready'] or result['failed']:
+        _notify_ui(event='refresh', room=f'deployment.list.{user_id}',
+                   data={}, namespace='/stand')
+    return result
+
+
+def _start_rollout(deployment: Deployment, gettext: Callable) -> str:
+    """Starts tracking the rollout of the deployment applied to the
+    cluster. Returns the message for the deployment log."""
+    if deployment.current_status != DeploymentStatus.DEPLOYED_OLD:
+        deployment.current_status = DeploymentStatus.PENDING
+    image = deployment.image
+    rollouts.start(deployment, deployment.replicas,
+                   f'{image.name}:{image.tag}' if image else None)
+    return gettext('Deployment applied (port=%(port)s), waiting for '
+                   '%(replicas)s replica(s) to be available.',
+                   port=deployment.port, replicas=deployment.replicas)
+
+
+def _track_rollouts(target_id: int, versions: Dict[int, int], locale: str,
+                    user_id: int, check: int = 1) -> None:
+    """Schedules the next check of rollouts (see track_rollouts)"""
+    if not versions:
+        return
+    queue = rq.get_queue(scheduling.target_queue_name(target_id))
+    queue.enqueue_in(
+        datetime.timedelta(seconds=rollouts.check_interval(check)),
+        track_rollouts, target_id, versions, locale, user_id, check,
+        job_timeout=60, result_ttl=3600)
+
+
+def is_transient(e: Exception) -> bool:
+    """Errors of Kubernetes API (throttling, unavailable API server or
+    connection failures) that may not happen if the request is retried"""
+    if isinstance(e, ApiException):
+        return e.status in TRANSIENT_STATUSES
+    return isinstance(e, urllib3.exceptions.HTTPError)
+
+
+def retry_delay(e: Exception, attempt: int) -> float:
+    """Delay (seconds) before the next attempt: exponential backoff with
+    full jitter, but not less than the Retry-After header of the error"""
+    delay = random.uniform(
+        0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+    return max(delay, _retry_after(e))
+
+
+def _retry_after(e: Exception) -> float:
+    headers = getattr(e, 'headers', None)
+    value = headers.get('Retry-After') if headers else None
+    if not value:
+        return 0
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        # HTTP date
+        date = email.utils.parsedate_to_datetime(value)
+        return max(0.0, (date - datetime.datetime.now(
+            datetime.timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return 0
+
+
+def _retry_later(deployment: Optional[Deployment], e: Exception,
+                 action: Callable, locale: str, user_id: int,
+                 gettext: Callable) -> bool:
+    """Schedules the job again if the error is transient and the deployment
+    has attempts left. The worker does not wait: the new job is kept in the
+    scheduled job registry of the target queue until the delay expires
+    (see scheduling.TargetWorker). Deployment status does not change and
+    the attempt is logged.
+
+    Returns:
+        bool: True if the job was scheduled again
+    """
+    max_attempts = current_app.config.get('DEPLOY_MAX_ATTEMPTS',
+                                          MAX_ATTEMPTS)
+    if (deployment is None or not is_transient(e)
+            or (deployment.attempts or 0) + 1 >= max_attempts):
+        return False
+    try:
+        # An error discards only the changes of this attempt (savepoint),
+        # not the uncommitted changes of other deployments of a bulk deploy
+        with db.session.begin_nested():
+            deployment.attempts = (deployment.attempts or 0) + 1
+            delay = retry_delay(e, deployment.attempts)
+            job_id = str(uuid.uuid4())
+            deployment.execution_id = job_id
+            db.session.add(DeploymentLog(
+                status=deployment.current_status,
+                deployment_id=deployment.id,
+                log=gettext('Attempt %(attempt)s of %(max)s failed: '
+                            '%(error)s. Retrying in %(delay)s seconds.',
+                            attempt=deployment.attempts, max=max_attempts,
+                            error=_error_message(e, gettext),
+                            delay=round(delay))))
+        db.session.commit()
+
+        # Same version: a newer job for the deployment still supersedes it
+        queue = rq.get_queue(
+            scheduling.target_queue_name(deployment.target_id))
+        queue.enqueue_in(datetime.timedelta(seconds=delay), action,
+                         deployment.id, locale, user_id, deployment.version,
+                         job_id=job_id, job_timeout=60, result_ttl=3600)
+    except Exception:
+        logger.exception('Unable to retry job for deployment %s',
+                         deployment.id)
+        if not db.session.is_active:
+            # Commit failed, the transaction is lost
+            db.session.rollback()
+        return False
+    logger.warning('Job for deployment %s failed (attempt %s), retrying '
+                   'in %.1f s: %s', deployment.id, deployment.attempts,
+                   delay, e)
+    return True
+
+
+def _error_message(e: Exception, gettext: Callable) -> str:
+    if isinstance(e, ApiException) and e.status in (404, 409):
+        status = json.loads(e.body)
+        msg = {
+            404: '%(kind)s %(name)s not found.',
+            409: '%(kind)s %(name)s already exists.',
+        }
+        name = status.get('details', {}).get('name')
+        kind = status.get('details', {}).get('kind', " ")[:-1]
+        return gettext(msg[e.status], kind=kind, name=name)
+    return gettext('Error in deployment: %(error)s', error=str(e))
+
+
 def _log_message_for_deployment(deployment_id: int, log_message: str,
                                 status: DeploymentStatus) -> None:
     log = DeploymentLog(
@@ -1,8 +1,69 @@
+import hashlib
+import json
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
 import requests
 from flask import current_app
+from flask_babel import gettext
 from kubernetes import client, config
+from kubernetes.client import ApiClient
+from kubernetes.client.exceptions import ApiException
+from requests.adapters import HTTPAdapter
 from urllib import parse
-START_PORT = 31160
+from urllib3.util.retry import Retry
+
+from seed import manifests
+from seed.models import DeploymentStatus
+
+# Model URLs are cached for this time (seconds)
+MODEL_URL_TTL = 300
+MODEL_URL_CACHE_SIZE = 2048
+# Only deployments created by Seed have this label (value is the version)
+DEPLOYMENT_LABEL = 'seed/deployment-version'
+# Hash of the last manifest applied by Seed (see create_deployment)
+SPEC_HASH_ANNOTATION = 'seed/spec-hash'
+# API version of the autoscaler created for the deployment, if any
+AUTOSCALER_ANNOTATION = 'seed/autoscaler'
+# Connect and read timeouts (seconds) for Limonero API
+LIMONERO_TIMEOUT = (3.05, 10)
+LIMONERO_POOL_SIZE = 10
+
+
+class ApiCallCounter:
+    """Counts calls to Kubernetes API, by HTTP method and resource path"""
+    def __init__(self):
+        self._calls = Counter()
+        self._lock = threading.Lock()
+
+    def add(self, method: str, resource_path: str) -> None:
+        with self._lock:
+            self._calls[f'{method} {resource_path}'] += 1
+
+    def reset(self) -> dict:
+        """Returns the calls counted since the last reset and starts over"""
+        with self._lock:
+            calls, self._calls = self._calls, Counter()
+        return dict(calls, total=sum(calls.values()))
+
+
+api_calls = ApiCallCounter()
+
+
+class CountingApiClient(ApiClient):
+    """ApiClient that records every request in api_calls. If rate_limiter
+    is set, requests wait for its permission (see
+    seed.scheduling.ApiRateLimiter)."""
+    rate_limiter = None
+
+    def call_api(self, resource_path, method, *args, **kwargs):
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        api_calls.add(method, resource_path)
+        return super().call_api(resource_path, method, *args, **kwargs)
 
 
 def _handle_cpu_limit(limit):
@@ -11,16 +72,125 @@ def _handle_cpu_limit(limit):
     return limit
 
 
+class ModelUrlResolver:
+    """Resolves the storage URL of models using Limonero API. Requests share
+    a pooled HTTP session and have timeouts (LIMONERO_TIMEOUT), and URLs are
+    cached by model id for MODEL_URL_TTL seconds. Concurrent requests for the
+    same model wait for a single call to Limonero. The cache is kept by the
+    process, so it is shared by the jobs of a worker (scheduling.TargetWorker
+    does not fork) and by the threads of bulk deploys.
+    """
+    def __init__(self, ttl: int = MODEL_URL_TTL,
+                 max_size: int = MODEL_URL_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._cache: Dict[int, Tuple[float, str]] = {}
+        self._in_flight: Dict[int, threading.Event] = {}
+        self._lock = threading.Lock()
+        self._session = None
+
+    def resolve(self, model_id: int) -> str:
+        return self._resolve(model_id, self._limonero_config())
+
+    def resolve_many(self, model_ids: Iterable[int],
+                     max_workers: int = 8) -> Dict[int, str]:
+        """Resolves many (distinct) models, fetching missing ones in
+        parallel. Used to warm up the cache in bulk deploys."""
+        limonero_config = self._limonero_config()
+        model_ids = list({m for m in model_ids if m is not None})
+        with ThreadPoolExecutor(
+                max_workers=max(1, min(max_workers, len(model_ids)))) as ex:
+            urls = ex.map(lambda m: self._resolve(m, limonero_config),
+                          model_ids)
+            return dict(zip(model_ids, urls))
+
+    def invalidate(self, model_id: Optional[int] = None) -> None:
+        with self._lock:
+            if model_id is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(model_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'size': len(self._cache)}
+
+    # region Protected
+    def _limonero_config(self) -> dict:
+        config = current_app.config
+        return dict(config['SEED_CONFIG']['services']['limonero'],
+                    timeout=config.get('LIMONERO_TIMEOUT', LIMONERO_TIMEOUT))
+
+    def _resolve(self, model_id: int, limonero_config: dict) -> str:
+        while True:
+            with self._lock:
+                cached = self._cache.get(model_id)
+                if cached is not None and cached[0] > time.monotonic():
+                    self.hits += 1
+                    return cached[1]
+                in_flight = self._in_flight.get(model_id)
+                if in_flight is None:
+                    self.misses += 1
+                    in_flight = self._in_flight[model_id] = threading.Event()
+                    break
+            # Another thread is fetching the same model. If it fails, this
+            # thread tries again.
+            in_flight.wait(limonero_config['timeout'][1])
+        try:
+            url = self._fetch(model_id, limonero_config)
+            now = time.monotonic()
+            with self._lock:
+                if len(self._cache) >= self.max_size:
+                    # Remove expired entries, or everything if none expired
+                    expired = [k for k, v in self._cache.items()
+                               if v[0] <= now]
+                    for k in expired or list(self._cache.keys()):
+                        del self._cache[k]
+                self._cache[model_id] = (now + self.ttl, url)
+            return url
+        finally:
+            with self._lock:
+                self._in_flight.pop(model_id, None)
+            in_flight.set()
+
+    def _fetch(self, model_id: int, limonero_config: dict) -> str:
+        resp = self._get_session().get(
+            f"{limonero_config['url']}/models/{model_id}",
+            headers={'X-Auth-Token': str(limonero_config['auth_token'])},
+            timeout=limonero_config['timeout'])
+        resp.raise_for_status()
+        data = resp.json()
+        return data['storage']['url'] + data['path']
+
+    def _get_session(self) -> requests.Session:
+        with self._lock:
+            if self._session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_maxsize=LIMONERO_POOL_SIZE,
+                    max_retries=Retry(total=2, backoff_factor=0.2,
+                                      status_forcelist=(502, 503, 504)))
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self._session = session
+            return self._session
+    # endregion
+
+
+model_urls = ModelUrlResolver()
+
+
 def _get_model_url(model_id: int) -> str:
-    config = current_app.config['SEED_CONFIG']
-    limonero_config = config['services']['limonero']
-    resp = requests.get(f"{limonero_config['url']}/models/{model_id}",
-                        headers={'X-Auth-Token': str(limonero_config['auth_token'])})
-    data = resp.json()
-    return data['storage']['url'] + data['path']
+    return model_urls.resolve(model_id)
 
 
-def create_deployment(deployment, deployment_image, deployment_target, api):
+def render_deployment(deployment, deployment_image,
+                      deployment_target) -> client.V1Deployment:
+    """Kubernetes deployment (manifest) for the deployment, used when the
+    target has no descriptor"""
 
     #Table: Pod
     pod_name = deployment.internal_name
@@ -74,7 +244,9 @@ def create_deployment(deployment, deployment_image, deployment_target, api):
     # Create and configure a spec section.
     template = client.V1PodTemplateSpec(
         metadata=client.V1ObjectMeta(
-            labels= {'app': pod_name, 'seed/deployment-version': str(deployment.version)}
+            # Version is not a label of pods, because changing the pod
+            # template restarts them
+            labels= {'app': pod_name}
 
         ),
         spec=client.V1PodSpec(containers=[container], volumes=volumes),
@@ -91,30 +263,242 @@ def create_deployment(deployment, deployment_image, deployment_target, api):
         metadata=client.V1ObjectMeta(
             name=deployment.internal_name,
             labels={
-                'seed/deployment-version': str(deployment.version)
+                DEPLOYMENT_LABEL: str(deployment.version)
             }), spec=spec,
     )
 
-    if _deployment_exists(api, ns, deployment.internal_name):
+    return deployment_obj
+
+
+def render_manifests(deployment, deployment_image, deployment_target,
+                     api) -> Dict[str, dict]:
+    """Manifests of the deployment by kind ('deployment', 'service' and,
+    optionally, 'autoscaler'), rendered from the descriptor of the target
+    (see seed.manifests) or, if it has none, built in. Names and the version
+    label are always set by Seed, because they identify the resources."""
+    serialize = api.api_client.sanitize_for_serialization
+    name = deployment.internal_name
+    service = serialize(_render_service(name, deployment_target.port,
+                                        deployment.port))
+    if not (deployment_target.descriptor or '').strip():
+        return {'deployment': serialize(render_deployment(
+                    deployment, deployment_image, deployment_target)),
+                'service': service}
+
+    model_url = _get_model_url(deployment.model_id)
+    result = manifests.render(deployment_target.descriptor, {
+        'name': name,
+        'service_name': _get_service_name(name),
+        'namespace': deployment_target.namespace,
+        'deployment_id': deployment.id,
+        'replicas': int(deployment.replicas),
+        'image': f'{deployment_image.name}:{deployment_image.tag}',
+        'model_url': model_url,
+        'model_scheme': parse.urlparse(model_url).scheme,
+        'request_cpu': _handle_cpu_limit(deployment.request_cpu),
+        'request_memory': deployment.request_memory,
+        'limit_cpu': _handle_cpu_limit(deployment.limit_cpu),
+        'limit_memory': deployment.limit_memory,
+        'port': deployment.port,
+        'target_port': deployment_target.port,
+    })
+    result.setdefault('service', service)
+    for key, resource_name in (('deployment', name),
+                               ('service', _get_service_name(name)),
+                               ('autoscaler', name)):
+        if key in result:
+            metadata = result[key].get('metadata') or {}
+            metadata.pop('namespace', None)
+            result[key]['metadata'] = dict(metadata, name=resource_name)
+    metadata = result['deployment']['metadata']
+    metadata['labels'] = dict(metadata.get('labels') or {},
+                              **{DEPLOYMENT_LABEL: str(deployment.version)})
+
+    autoscaler = result.get('autoscaler')
+    if autoscaler is not None:
+        if autoscaler.get('apiVersion') not in _AUTOSCALING_APIS:
+            raise manifests.ManifestError(
+                'Invalid descriptor: unsupported HorizontalPodAutoscaler '
+                f"version {autoscaler.get('apiVersion')}")
+        autoscaler.setdefault('spec', {})['scaleTargetRef'] = {
+            'apiVersion': 'apps/v1', 'kind': 'Deployment', 'name': name}
+        # Replicas are managed by the autoscaler
+        (result['deployment'].get('spec') or {}).pop('replicas', None)
+    return result
+
+
+def create_deployment(deployment, deployment_image, deployment_target, api,
+                      dry_run: bool = False) -> Optional[Dict[str, list]]:
+    """Applies the deployment, its service and autoscaler to the cluster
+    (see render_manifests). The hash of the manifests is kept in an
+    annotation (SPEC_HASH_ANNOTATION) and, if it did not change since the
+    last deploy, no resource is patched: only the version label is updated,
+    which does not restart pods. The annotation is written only after all
+    resources are applied, so a deploy that fails midway is fully applied
+    when retried. Changes made to the cluster by other tools are not
+    detected by the hash.
+
+    If dry_run, nothing is changed and the differences between the
+    resources in the cluster and the manifests are returned.
+
+    Arguments are only read (they may be copies of the models, see
+    jobs._deploy_target), and the node port of the deployment must be
+    allocated by the caller (see node_ports.allocate).
+    """
+    ns = deployment_target.namespace
+    target_port = deployment_target.port
+    rendered = render_manifests(deployment, deployment_image,
+                                deployment_target, api)
+    manifest = rendered['deployment']
+    digest = spec_hash(rendered)
+    annotations = manifest['metadata'].get('annotations') or {}
+    manifest['metadata']['annotations'] = annotations
+    autoscaler = rendered.get('autoscaler')
+    if autoscaler is not None:
+        annotations[AUTOSCALER_ANNOTATION] = autoscaler['apiVersion']
+
+    current = read_deployment(deployment.internal_name, ns, api)
+    if dry_run:
+        return _diff_resources(current, rendered, ns, api)
+    current_annotations = (current.metadata.annotations or {}
+                           if current is not None else {})
+    if current is None:
+        api.create_namespaced_deployment(body=manifest, namespace=ns)
+    elif current_annotations.get(SPEC_HASH_ANNOTATION) != digest:
+        # Removes the version label from pods created by older versions
+        template_labels = (((manifest.get('spec') or {}).get('template')
+                            or {}).get('metadata') or {}).get('labels')
+        if template_labels is not None:
+            template_labels.setdefault(DEPLOYMENT_LABEL, None)
+        annotations.setdefault(AUTOSCALER_ANNOTATION, None)
+        # Set again when the service and autoscaler are applied
+        annotations[SPEC_HASH_ANNOTATION] = None
         api.patch_namespaced_deployment(name=deployment.internal_name,
-                                        body=deployment_obj, namespace=ns)
+                                        body=manifest, namespace=ns)
     else:
-        api.create_namespaced_deployment(body=deployment_obj, namespace=ns)
+        if rollout_version(current) != deployment.version:
+            api.patch_namespaced_deployment(
+                name=deployment.internal_name, namespace=ns,
+                body={'metadata': {'labels': {
+                    DEPLOYMENT_LABEL: str(deployment.version)}}})
+        return None
+
+    if autoscaler is not None:
+        _apply_autoscaler(autoscaler, ns, api)
+    elif AUTOSCALER_ANNOTATION in current_annotations:
+        # Autoscaler was removed from the descriptor
+        _delete_autoscaler(deployment.internal_name, ns, api,
+                           current_annotations[AUTOSCALER_ANNOTATION])
+
     # Create service
-    target_port = deployment_target.port
+    create_service(deployment.internal_name, deployment_target.namespace,
+                   target_port, deployment.port, api,
+                   body=rendered['service'])
+    api.patch_namespaced_deployment(
+        name=deployment.internal_name, namespace=ns,
+        body={'metadata': {'annotations': {
+            SPEC_HASH_ANNOTATION: digest}}})
+    return None
+
+
+def spec_hash(rendered: Dict[str, dict]) -> str:
+    """Canonical hash of the manifests of a deployment (see
+    render_manifests). The version label is ignored, because it changes in
+    every deploy."""
+    deployment = rendered['deployment']
+    labels = dict(deployment['metadata'].get('labels') or {})
+    labels.pop(DEPLOYMENT_LABEL, None)
+    data = dict(rendered, deployment=dict(
+        deployment, metadata=dict(deployment['metadata'], labels=labels)))
+    return hashlib.sha256(json.dumps(
+        data, sort_keys=True, separators=(',', ':'),
+        default=str).encode()).hexdigest()
+
+
+def diff(current, new, path: str = '') -> List[dict]:
+    """Differences between an object in the cluster and the manifest (new)
+    applied to it. Only fields set by the manifest are compared, so
+    defaults and status filled by Kubernetes are ignored."""
+    if isinstance(new, dict) and isinstance(current, dict):
+        return [change for key in sorted(new)
+                for change in diff(current.get(key), new[key],
+                                   f'{path}.{key}' if path else key)]
+    if (isinstance(new, list) and isinstance(current, list)
+            and len(new) == len(current)):
+        return [change for i, (c, n) in enumerate(zip(current, new))
+                for change in diff(c, n, f'{path}[{i}]')]
+    if current != new:
+        return [{'path': path, 'current': current, 'new': new}]
+    return []
+
+
+def _diff_resources(current: Optional[client.V1Deployment],
+                    rendered: Dict[str, dict], namespace: str,
+                    api) -> Dict[str, list]:
+    serialize = api.api_client.sanitize_for_serialization
+    api_core = client.CoreV1Api(api_client=api.api_client)
+    service = rendered['service']
+    current_service = _read_service(service['metadata']['name'], namespace,
+                                    api_core)
+    result = {
+        'deployment': diff(serialize(current), rendered['deployment']),
+        'service': diff(serialize(current_service), service),
+    }
+    autoscaler = rendered.get('autoscaler')
+    if autoscaler is not None:
+        result['autoscaler'] = diff(serialize(_read_autoscaler(
+            autoscaler, namespace, api)), autoscaler)
+    return result
+
+
+########### HorizontalPodAutoscaler ##########
 
-    deployment.port = create_service(deployment.internal_name,
-                                     deployment_target.namespace, target_port,
-                                     deployment.port, api)
+# Kubernetes API for each version of HorizontalPodAutoscaler
+_AUTOSCALING_APIS = {
+    'autoscaling/v1': client.AutoscalingV1Api,
+    'autoscaling/v2beta1': client.AutoscalingV2beta1Api,
+    'autoscaling/v2beta2': client.AutoscalingV2beta2Api,
+}
 
 
-def _get_next_port(services):
-    ports = [START_PORT]
-    for service in (services or []):
-        service_ports = service.get('spec', {}).get('ports',[]) or []
-        ports += [p.get('port', 0) for p in service_ports]
+def _autoscaling_api(api_version: str, api):
+    return _AUTOSCALING_APIS[api_version](api_client=api.api_client)
 
-    return max(ports) + 1
+
+def _read_autoscaler(body: dict, namespace: str, api) -> Optional[object]:
+    try:
+        return _autoscaling_api(body['apiVersion'], api) \
+            .read_namespaced_horizontal_pod_autoscaler(
+                body['metadata']['name'], namespace)
+    except ApiException as e:
+        if e.status != 404:
+            raise
+        return None
+
+
+def _apply_autoscaler(body: dict, namespace: str, api) -> None:
+    """Patches the autoscaler, or creates it if it does not exist yet"""
+    api_autoscaling = _autoscaling_api(body['apiVersion'], api)
+    try:
+        api_autoscaling.patch_namespaced_horizontal_pod_autoscaler(
+            name=body['metadata']['name'], namespace=namespace, body=body)
+    except ApiException as e:
+        if e.status != 404:
+            raise
+        api_autoscaling.create_namespaced_horizontal_pod_autoscaler(
+            namespace=namespace, body=body)
+
+
+def _delete_autoscaler(name: str, namespace: str, api,
+                       api_version: str = 'autoscaling/v1') -> None:
+    # Any version of the API deletes the autoscaler
+    api_class = _AUTOSCALING_APIS.get(api_version, client.AutoscalingV1Api)
+    try:
+        api_class(api_client=api.api_client) \
+            .delete_namespaced_horizontal_pod_autoscaler(name, namespace)
+    except ApiException as e:
+        if e.status != 404:
+            raise
 
 
 def delete_deployment(deployment, deploymentTarget, api):
@@ -127,51 +511,129 @@ def delete_deployment(deployment, deploymentTarget, api):
         ),
     )
 
-    # Delete service
+    if deploymentTarget.descriptor:
+        _delete_autoscaler(deployment.internal_name,
+                           deploymentTarget.namespace, api)
+
+    # Delete service (the node port is released and may be reused)
     try:
-        api_core = client.CoreV1Api()
-        service_name = _get_service_name(deployment.name)
+        api_core = client.CoreV1Api(api_client=api.api_client)
+        service_name = _get_service_name(deployment.internal_name)
         delete_service(service_name, deploymentTarget.namespace, api_core)
-    except:
-        pass
-
+    except ApiException as e:
+        if e.status != 404:
+            raise
 
-def _deployment_exists(api, namespace: str, deployment_name: str) -> bool:
-    resp = api.list_namespaced_deployment(namespace=namespace)
-    for i in resp.items:
-        if i.metadata.name == deployment_name:
-            return True
-    return False
 
 ########### Service ##########
 
 
-def _get_all_services(api: client.CoreV1Api):
-    field_selector = 'metadata.namespace!=kube-system,metadata.namespace!=default'
-    services = api.list_service_for_all_namespaces(
-        field_selector=field_selector, watch=False)
-    return services.to_dict().get('items')
+def get_node_ports(api) -> Set[int]:
+    """NodePorts used by services in all namespaces of the cluster"""
+    api_core = client.CoreV1Api(api_client=api.api_client)
+    services = api_core.list_service_for_all_namespaces(watch=False)
+    return {p.node_port for s in services.items
+            for p in (s.spec.ports or []) if p.node_port}
 
 
-def create_service(deployment_name: str, namespace: str,
-                   target_port: int, port: int, api) -> int:
+def read_deployment(name: str, namespace: str,
+                    api) -> Optional[client.V1Deployment]:
+    """Returns the Kubernetes deployment, or None if it does not exist"""
+    try:
+        return api.read_namespaced_deployment(name, namespace)
+    except ApiException as e:
+        if e.status == 404:
+            return None
+        raise
+
+
+def list_deployments(namespace: str, api) -> list:
+    """Kubernetes deployments created by Seed in the namespace"""
+    return api.list_namespaced_deployment(
+        namespace, label_selector=DEPLOYMENT_LABEL).items
+
+
+def rollout_version(k8s_deployment: client.V1Deployment) -> Optional[int]:
+    """Version of the deployment applied to the cluster (see
+    DEPLOYMENT_LABEL)"""
+    value = (k8s_deployment.metadata.labels or {}).get(DEPLOYMENT_LABEL)
+    return int(value) if value and value.isdigit() else None
+
+
+def rollout_status(k8s_deployment: client.V1Deployment,
+                   gettext: Callable = gettext) -> Tuple[str, str]:
+    """Maps the status of a Kubernetes deployment to a DeploymentStatus and a
+    message for the deployment log"""
+    replicas = k8s_deployment.spec.replicas
+    replicas = 1 if replicas is None else replicas
+    status = k8s_deployment.status or client.V1DeploymentStatus()
+    conditions = {c.type: c for c in status.conditions or []}
+    progressing = conditions.get('Progressing')
+    available = conditions.get('Available')
+    ready = status.available_replicas or 0
+
+    if progressing and progressing.reason == 'ProgressDeadlineExceeded':
+        return DeploymentStatus.ERROR, progressing.message
+    if ((status.observed_generation or 0) >= (
+            k8s_deployment.metadata.generation or 0)
+            and (status.updated_replicas or 0) >= replicas
+            and ready >= replicas
+            and (status.replicas or 0) <= replicas):
+        return DeploymentStatus.DEPLOYED, gettext(
+            'Deployment available (%(ready)s/%(total)s replicas).',
+            ready=ready, total=replicas)
+    if (available and available.status == 'False' and progressing
+            and progressing.reason == 'NewReplicaSetAvailable'):
+        # Rollout had finished, but pods are not available anymore
+        return DeploymentStatus.ERROR, available.message
+    return DeploymentStatus.PENDING, gettext(
+        'Rolling out (%(ready)s/%(total)s replicas available).',
+        ready=ready, total=replicas)
+
+
+def _read_service(service_name: str, namespace: str,
+                  api_core: client.CoreV1Api) -> Optional[client.V1Service]:
+    try:
+        return api_core.read_namespaced_service(name=service_name,
+                                                namespace=namespace)
+    except ApiException as e:
+        if e.status != 404:
+            raise
+        return None
 
-    #import pdb
-    # pdb.set_trace()
 
+def create_service(deployment_name: str, namespace: str,
+                   target_port: int, port: int, api,
+                   body: Optional[dict] = None) -> int:
+    """Creates the NodePort service for the deployment (body is the
+    rendered manifest, see render_manifests). If the service already
+    exists, it is patched only if its spec changed (no change when an
+    existing deployment is redeployed), keeping the endpoint available.
+    """
     api_core = client.CoreV1Api(api_client=api.api_client)
-    services = _get_all_services(api_core)
-
     service_name = _get_service_name(deployment_name)
-    service_exists = False
-    for s in services:
-        if s.get('metadata', {}).get('name') == service_name:
-            service_exists = True
-            #port = s['spec']['ports'][0]['node_port']
-            break
+    if body is None:
+        body = api.api_client.sanitize_for_serialization(
+            _render_service(deployment_name, target_port, port))
+
+    current = _read_service(service_name, namespace, api_core)
+    if current is None:
+        api_core.create_namespaced_service(namespace=namespace, body=body)
+    elif diff(api.api_client.sanitize_for_serialization(current), body):
+        # Strategic merge patch. Ports are merged by their port number, so
+        # the list is replaced to drop a port that is not used anymore.
+        patch = body
+        if isinstance(body['spec'].get('ports'), list):
+            patch = dict(body, spec=dict(body['spec'], ports=body['spec'][
+                'ports'] + [{'$patch': 'replace'}]))
+        api_core.patch_namespaced_service(name=service_name,
+                                          namespace=namespace, body=patch)
+    return port
 
-    if port is None:
-        port = _get_next_port(services)
+
+def _render_service(deployment_name: str, target_port: int,
+                    port: int) -> client.V1Service:
+    service_name = _get_service_name(deployment_name)
 
     # User interface parameters
     version = "v1"
@@ -187,7 +649,8 @@ def create_service(deployment_name: str, namespace: str,
             selector={"app": deployment_name},
             ports=[client.V1ServicePort(
                 name='api',
-                node_port=int(port),
+                # Not allocated yet (dry run)
+                node_port=int(port) if port is not None else None,
                 port=int(target_port),
                 target_port=int(target_port),
                 protocol='TCP',
@@ -195,20 +658,7 @@ def create_service(deployment_name: str, namespace: str,
             type='NodePort'
         )
     )
-
-    try:
-        if service_exists:
-        #api_core.patch_namespaced_service(name=service_name,
-        #                                  namespace=deployment_namespace, body=body)
-            delete_service(service_name, namespace, api_core)
-            #api_core.delete_namespaced_service(name=service_name,
-            #    namespace=namespace)
-    except:
-        pass
-    api_core.create_namespaced_service(namespace=namespace,
-                                       body=body)
-
-    return port
+    return body
 
 
 def _get_service_name(deployment_name):
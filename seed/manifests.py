@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+Kubernetes manifests rendered from the descriptor of a deployment target.
+A descriptor is a Jinja2 template of YAML documents: a Deployment and,
+optionally, a Service and a HorizontalPodAutoscaler. It allows operators to
+change probes, node selectors, sidecars, etc. per cluster, without code
+changes. Templates are compiled once per descriptor and cached, so
+rendering only runs the compiled template and parses its output.
+
+Variables available in templates (see k8s_crud.render_manifests):
+name, service_name, namespace, deployment_id, replicas, image, model_url,
+model_scheme, request_cpu, request_memory, limit_cpu, limit_memory, port
+(node port of the service) and target_port. Strings can be quoted with the
+tojson filter, e.g. `image: {{ image|tojson }}`.
+"""
+from functools import lru_cache
+from typing import Dict
+
+import yaml
+from jinja2 import StrictUndefined, Template, TemplateError
+from jinja2.sandbox import SandboxedEnvironment
+
+# Maximum number of compiled templates kept in memory
+TEMPLATE_CACHE_SIZE = 64
+# Kinds of documents allowed in descriptors, and their keys in the result
+# of render()
+KINDS = {
+    'Deployment': 'deployment',
+    'Service': 'service',
+    'HorizontalPodAutoscaler': 'autoscaler',
+}
+
+# LibYAML parser, if available, is much faster
+_Loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+# Undefined variables are errors, instead of empty values
+_environment = SandboxedEnvironment(undefined=StrictUndefined)
+
+
+class ManifestError(ValueError):
+    """Invalid descriptor or rendered manifests"""
+
+
+@lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def compile_template(descriptor: str) -> Template:
+    """Compiled template of the descriptor (cached by its content, so a
+    changed descriptor is compiled again)"""
+    try:
+        return _environment.from_string(descriptor)
+    except TemplateError as e:
+        raise ManifestError(f'Invalid descriptor: {e}') from e
+
+
+def render(descriptor: str, context: dict) -> Dict[str, dict]:
+    """Renders the descriptor. Returns the manifests by kind (see KINDS)"""
+    template = compile_template(descriptor)
+    try:
+        documents = [d for d in yaml.load_all(template.render(context),
+                                              Loader=_Loader) if d]
+    except (TemplateError, yaml.YAMLError) as e:
+        raise ManifestError(f'Invalid descriptor: {e}') from e
+
+    result = {}
+    for document in documents:
+        kind = document.get('kind') if isinstance(document, dict) else None
+        key = KINDS.get(kind)
+        if key is None or key in result:
+            raise ManifestError(
+                f'Invalid descriptor: unexpected document (kind={kind})')
+        result[key] = document
+    if 'deployment' not in result:
+        raise ManifestError('Invalid descriptor: Deployment is required')
+    return result
@@ -268,6 +268,10 @@ class DeploymentTarget(db.Model):
     target_type = Column(Enum(*list(DeploymentTargetType.values()),
                               name='DeploymentTargetTypeEnumType'), nullable=False)
     descriptor = Column(LONGTEXT)
+    # Maximum of jobs running at the same time and of Kubernetes API calls
+    # per second (see seed.scheduling). Null: default limit, 0: unlimited
+    max_running_jobs = Column(Integer)
+    api_rate_limit = Column(Integer)
 
     def __str__(self):
         return self.name
@@ -276,6 +280,79 @@ class DeploymentTarget(db.Model):
         return '<Instance {}: {}>'.format(self.__class__, self.id)
 
 
+class NodePortAllocation(db.Model):
+    """ NodePort allocated to a deployment in a target """
+    __tablename__ = 'node_port_allocation'
+    __table_args__ = (
+        UniqueConstraint('target_id', 'port',
+                         name='uq_node_port_allocation_target_port'),)
+
+    # Fields
+    id = Column(Integer, primary_key=True)
+    port = Column(Integer, nullable=False)
+    free = Column(Boolean,
+                  default=False, nullable=False)
+    updated = Column(DateTime,
+                     default=func.now(), nullable=False,
+                     onupdate=datetime.datetime.utcnow)
+
+    # Associations
+    target_id = Column(Integer,
+                       ForeignKey("deployment_target.id",
+                                  name="fk_node_port_allocation_target_id"),
+                       nullable=False)
+    target = relationship(
+        "DeploymentTarget",
+        foreign_keys=[target_id])
+    deployment_id = Column(Integer,
+                           ForeignKey("deployment.id",
+                                      name="fk_node_port_allocation_deployment_id"),
+                           index=True)
+    deployment = relationship(
+        "Deployment",
+        foreign_keys=[deployment_id])
+
+    def __str__(self):
+        return str(self.port)
+
+    def __repr__(self):
+        return '<Instance {}: {}>'.format(self.__class__, self.id)
+
+
+class DeploymentRollout(db.Model):
+    """ Rollout of a deployment version, from the deploy job until all
+    replicas are available (time to ready) or the rollout fails """
+    __tablename__ = 'deployment_rollout'
+
+    # Fields
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False)
+    replicas = Column(Integer, nullable=False)
+    image = Column(String(500))
+    started = Column(DateTime,
+                     default=datetime.datetime.utcnow, nullable=False)
+    finished = Column(DateTime)
+    time_to_ready = Column(Float)
+    status = Column(Enum(*list(DeploymentStatus.values()),
+                         name='DeploymentStatusEnumType'), nullable=False)
+
+    # Associations
+    deployment_id = Column(Integer,
+                           ForeignKey("deployment.id",
+                                      name="fk_deployment_rollout_deployment_id"),
+                           nullable=False,
+                           index=True)
+    deployment = relationship(
+        "Deployment",
+        foreign_keys=[deployment_id])
+
+    def __str__(self):
+        return str(self.started)
+
+    def __repr__(self):
+        return '<Instance {}: {}>'.format(self.__class__, self.id)
+
+
 class MetricValue(db.Model):
     """ Metric values """
     __tablename__ = 'metric_value'
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+Allocation of Kubernetes NodePorts to deployments. Ports are reserved in the
+node_port_allocation table (unique by target and port), so allocating a port
+does not require listing the services of the cluster and two workers never
+get the same port.
+"""
+import logging
+from typing import Iterable, Set
+
+from flask_babel import gettext
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+from seed.models import Deployment, NodePortAllocation, db
+
+logger = logging.getLogger(__name__)
+
+# Ports are allocated after START_PORT, up to the end of the default
+# Kubernetes NodePort range
+START_PORT = 31160
+END_PORT = 32767
+
+# Attempts to allocate a port when other workers are allocating concurrently
+MAX_ATTEMPTS = 5
+
+
+def allocate(deployment: Deployment) -> int:
+    """Reserves a NodePort for the deployment in its target and commits the
+    reservation. A port already reserved for the deployment is kept, and
+    ports released by undeployed deployments are reused before new ones.
+
+    Returns:
+        int: Allocated port
+    """
+    # Ports reserved in a previous target are not needed anymore
+    NodePortAllocation.query.filter(
+        NodePortAllocation.deployment_id == deployment.id,
+        NodePortAllocation.target_id != deployment.target_id).update(
+            {'deployment_id': None, 'free': True}, synchronize_session=False)
+
+    # Ports already tried. The transaction is not restarted after a
+    # conflict (it may have changes of the caller) and, with REPEATABLE
+    # READ, its reads do not see the ports reserved by other workers, so
+    # the next attempt starts above the conflicting port.
+    tried = set()
+    for _ in range(MAX_ATTEMPTS):
+        try:
+            with db.session.begin_nested():
+                port = _reserve(deployment, tried)
+            db.session.commit()
+            return port
+        except IntegrityError:
+            # Another worker reserved the same port, try the next one
+            logger.debug('Port conflict for deployment %s, retrying',
+                         deployment.id)
+    raise ValueError(gettext('Unable to allocate a port for the deployment.'))
+
+
+def release(deployment_id: int) -> None:
+    """Marks the ports reserved for the deployment as free, to be reused.
+    Changes are committed by the caller.
+    """
+    NodePortAllocation.query.filter(
+        NodePortAllocation.deployment_id == deployment_id).update(
+            {'deployment_id': None, 'free': True}, synchronize_session=False)
+
+
+def reconcile(target_id: int, ports_in_use: Iterable[int]) -> int:
+    """Synchronizes the allocation table with the NodePorts in use in the
+    cluster (all services, including the ones not managed by Seed), in bulk.
+
+    * Ports in use and unknown to the table are reserved. If a deployment
+      was using the port, it becomes the owner.
+    * Free ports in use in the cluster are not free anymore.
+    * Ports reserved without an owner (external services) and not used in
+      the cluster anymore are freed.
+
+    Returns:
+        int: Number of changed allocations
+    """
+    ports_in_use = set(ports_in_use)
+    allocations = {a.port: a for a in NodePortAllocation.query.filter(
+        NodePortAllocation.target_id == target_id)}
+    owners = dict(db.session.query(Deployment.port, Deployment.id).filter(
+        Deployment.target_id == target_id, Deployment.port.isnot(None)))
+
+    changed = 0
+    for port in ports_in_use - set(allocations):
+        db.session.add(NodePortAllocation(
+            target_id=target_id, port=port, free=False,
+            deployment_id=owners.get(port)))
+        changed += 1
+    for port, allocation in allocations.items():
+        if port in ports_in_use and allocation.free:
+            allocation.free = False
+            allocation.deployment_id = owners.get(port)
+            changed += 1
+        elif (port not in ports_in_use and not allocation.free
+                and allocation.deployment_id is None):
+            allocation.free = True
+            changed += 1
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another worker reconciled the same target concurrently
+        db.session.rollback()
+        logger.info('Node ports for target %s reconciled by another worker',
+                    target_id)
+        return 0
+    return changed
+
+
+# region Protected
+def _reserve(deployment: Deployment, tried: Set[int]) -> int:
+    """Reserves a port, skipping the ones already tried (a new port tried
+    is added to them)"""
+    target_id = deployment.target_id
+    allocations = NodePortAllocation.query.filter(
+        NodePortAllocation.target_id == target_id)
+
+    allocation = allocations.filter(
+        NodePortAllocation.deployment_id == deployment.id).with_for_update(
+            ).first()
+    if allocation is not None:
+        return allocation.port
+
+    # Port used by a previous deployment of this service, if still available
+    if deployment.port is not None and deployment.port not in tried:
+        allocation = allocations.filter(
+            NodePortAllocation.port == deployment.port).with_for_update(
+                ).first()
+        if allocation is None:
+            tried.add(deployment.port)
+            return _insert(target_id, deployment.port, deployment.id)
+        if allocation.free:
+            return _assign(allocation, deployment.id)
+
+    allocation = allocations.filter(NodePortAllocation.free).order_by(
+        NodePortAllocation.port).with_for_update().first()
+    if allocation is not None:
+        return _assign(allocation, deployment.id)
+
+    last_port = db.session.query(func.max(NodePortAllocation.port)).filter(
+        NodePortAllocation.target_id == target_id).scalar()
+    port = max(last_port or START_PORT, START_PORT, *tried) + 1
+    if port > END_PORT:
+        raise ValueError(gettext('There are no ports available in target.'))
+    tried.add(port)
+    return _insert(target_id, port, deployment.id)
+
+
+def _assign(allocation: NodePortAllocation, deployment_id: int) -> int:
+    allocation.free = False
+    allocation.deployment_id = deployment_id
+    db.session.flush()
+    return allocation.port
+
+
+def _insert(target_id: int, port: int, deployment_id: int) -> int:
+    db.session.add(NodePortAllocation(
+        target_id=target_id, port=port, free=False,
+        deployment_id=deployment_id))
+    db.session.flush()
+    return port
+# endregion
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Sends events to the user interface (Stand) in a background thread, so a slow
+Stand does not stall the caller.
+"""
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of events waiting to be sent (newer events are dropped)
+QUEUE_SIZE = 1000
+# Duplicated events received in this window (seconds) are sent once
+COALESCE_WINDOW = 0.5
+# Events sent by the background thread in each round
+BATCH_SIZE = 50
+# Connect and read timeouts (seconds) for Stand API
+STAND_TIMEOUT = (2, 5)
+
+# Events that only ask the UI to reload data. Only the last one is sent
+COALESCED_EVENTS = ('refresh', )
+
+
+class UiNotifier:
+    """Bounded queue of events for Stand, sent in batches by a background
+    thread using a keep-alive session. Events in COALESCED_EVENTS for the
+    same room and namespace are merged while waiting to be sent.
+    """
+    def __init__(self, max_size: int = QUEUE_SIZE,
+                 window: float = COALESCE_WINDOW):
+        self.max_size = max_size
+        self.window = window
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self._pending = OrderedDict()
+        self._sending = 0
+        self._flushing = 0
+        self._sequence = 0
+        self._cond = threading.Condition()
+        self._thread = None
+        self._session = None
+
+    def notify(self, **data) -> None:
+        """Queues an event. Never blocks: if the queue is full, the event is
+        dropped."""
+        stand = current_app.config['SEED_CONFIG']['services'].get('stand')
+        if not stand:
+            return
+        with self._cond:
+            if data.get('event') in COALESCED_EVENTS:
+                key = (data.get('event'), data.get('room'),
+                       data.get('namespace'))
+            else:
+                self._sequence += 1
+                key = self._sequence
+            if key in self._pending:
+                self.coalesced += 1
+                self._pending[key] = (stand, data)
+                return
+            if len(self._pending) >= self.max_size:
+                self.dropped += 1
+                return
+            self._pending[key] = (stand, data)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name='ui-notifier', daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def flush(self, timeout: float) -> bool:
+        """Waits (at most timeout seconds) until queued events are sent.
+
+        Returns:
+            bool: True if there are no events left to send
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            # Pending events are sent without waiting for the coalescing
+            # window
+            self._flushing += 1
+            self._cond.notify_all()
+            try:
+                while self._pending or self._sending:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+            finally:
+                self._flushing -= 1
+        return True
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {'sent': self.sent, 'failed': self.failed,
+                    'dropped': self.dropped, 'coalesced': self.coalesced,
+                    'pending': len(self._pending)}
+
+    # region Protected
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                # Give duplicated events some time to arrive
+                deadline = time.monotonic() + self.window
+                while not self._flushing:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = []
+                while self._pending and len(batch) < BATCH_SIZE:
+                    batch.append(self._pending.popitem(last=False)[1])
+                self._sending = len(batch)
+            sent = sum(self._send(stand, data) for stand, data in batch)
+            with self._cond:
+                self.sent += sent
+                self.failed += len(batch) - sent
+                self._sending = 0
+                self._cond.notify_all()
+
+    def _send(self, stand: dict, data: dict) -> bool:
+        try:
+            resp = self._get_session().post(
+                f'{stand.get("url")}/room', data=json.dumps(data),
+                headers={'X-Auth-Token': str(stand.get('auth_token')),
+                         'Content-type': 'application/json'},
+                timeout=STAND_TIMEOUT)
+            logger.debug('Event sent to UI: %s %s', data, resp.status_code)
+            return resp.ok
+        except Exception as e:
+            logger.warning('Unable to send event to UI: %s', e)
+            return False
+
+    def _get_session(self) -> requests.Session:
+        if self._session is None:
+            self._session = requests.Session()
+        return self._session
+    # endregion
+
+
+notifier = UiNotifier()
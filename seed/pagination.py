@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+import base64
+import datetime
+import json
+import math
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from flask import abort
+from sqlalchemy import DateTime, and_, or_
+
+COUNT_EXACT = 'exact'
+COUNT_ESTIMATE = 'estimate'
+COUNT_NONE = 'none'
+COUNT_STRATEGIES = (COUNT_EXACT, COUNT_ESTIMATE, COUNT_NONE)
+DEFAULT_PAGE_SIZE = 20
+
+# Estimated counts are cached for a short period, per query
+ESTIMATE_TTL = 30
+ESTIMATE_CACHE_SIZE = 1024
+_estimates: Dict[str, Tuple[float, int]] = {}
+_estimates_lock = threading.Lock()
+
+
+def encode_cursor(sort: str, asc: bool, values: List[Any]) -> str:
+    """Builds an opaque token pointing to the last row of a page.
+
+    Args:
+        sort (str): Name of the sort attribute
+        asc (bool): Sort direction
+        values (list): Values of the sort attribute and id of the last row
+
+    Returns:
+        str: URL safe token
+    """
+    payload = [sort, asc] + [
+        v.isoformat() if isinstance(v, datetime.datetime) else v
+        for v in values]
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token: str, sort_column, sort: str, asc: bool) -> List[Any]:
+    """Parses a token created by encode_cursor(). Raises ValueError if the
+    token is malformed or was created for another sort order.
+    """
+    try:
+        padding = '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(token + padding))
+        token_sort, token_asc, value, last_id = payload
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if token_sort != sort or token_asc != asc or not isinstance(last_id, int):
+        raise ValueError('Invalid cursor')
+    if isinstance(sort_column.type, DateTime) and value is not None:
+        value = datetime.datetime.fromisoformat(value)
+    return [value, last_id]
+
+
+def keyset_paginate(query, sort_column, id_column, sort: str, asc: bool,
+                    page_size: int,
+                    cursor: Optional[str]) -> Tuple[list, Optional[str]]:
+    """Keyset (a.k.a. seek) pagination. Instead of using OFFSET and counting
+    all rows, it filters rows after the last one returned in the previous
+    page, using (sort_column, id_column) as a unique sort key.
+
+    Returns:
+        tuple: Items in the page and the cursor for the next page (None if
+            there is no more data).
+    """
+    if page_size < 1:
+        raise ValueError('Invalid page size')
+    if sort_column is id_column:
+        order = [id_column if asc else id_column.desc()]
+    else:
+        order = [sort_column, id_column] if asc else [
+            sort_column.desc(), id_column.desc()]
+
+    if cursor:
+        value, last_id = decode_cursor(cursor, sort_column, sort, asc)
+        if sort_column is id_column:
+            condition = id_column > last_id if asc else id_column < last_id
+        elif asc:
+            condition = or_(sort_column > value,
+                            and_(sort_column == value, id_column > last_id))
+        else:
+            condition = or_(sort_column < value,
+                            and_(sort_column == value, id_column < last_id))
+        query = query.filter(condition)
+
+    # Fetch one extra row to find out if there is a next page (no COUNT)
+    items = query.order_by(None).order_by(*order).limit(page_size + 1).all()
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        last = items[-1]
+        next_cursor = encode_cursor(
+            sort, asc, [getattr(last, sort_column.key),
+                        getattr(last, id_column.key)])
+    return items, next_cursor
+
+
+def get_page_size(value: Optional[str]) -> Optional[int]:
+    """Page size informed in the request (default is DEFAULT_PAGE_SIZE), or
+    None if it is not a positive integer"""
+    if value is None:
+        return DEFAULT_PAGE_SIZE
+    try:
+        page_size = int(value)
+    except ValueError:
+        return None
+    return page_size if page_size >= 1 else None
+
+
+def get_count_strategy(value: Optional[str]) -> str:
+    """Returns a valid count strategy (default is exact)"""
+    return value if value in COUNT_STRATEGIES else COUNT_EXACT
+
+
+def estimate_count(query) -> int:
+    """Count of rows returned by query, cached for ESTIMATE_TTL seconds.
+    The cache key is the SQL statement and its parameters, so different
+    filters are counted independently.
+    """
+    statement = query.order_by(None).statement
+    compiled = statement.compile()
+    key = '{}{}'.format(compiled, sorted(compiled.params.items()))
+    now = time.monotonic()
+    with _estimates_lock:
+        cached = _estimates.get(key)
+    if cached is not None and cached[0] > now:
+        return cached[1]
+
+    total = query.order_by(None).count()
+    with _estimates_lock:
+        if len(_estimates) >= ESTIMATE_CACHE_SIZE:
+            # Remove expired entries, or everything if none expired
+            expired = [k for k, v in _estimates.items() if v[0] <= now]
+            for k in expired or list(_estimates.keys()):
+                del _estimates[k]
+        _estimates[key] = (now + ESTIMATE_TTL, total)
+    return total
+
+
+def paginate(query, page: int, page_size: int, count: str = COUNT_EXACT,
+             total: Optional[int] = None) -> Tuple[list, dict]:
+    """Offset pagination with selectable count strategy:
+
+    * exact: COUNT(*) on every request (unless total is informed)
+    * estimate: count cached for a short time (see estimate_count())
+    * none: no count; fetches one extra row to find out if there is a next
+      page
+
+    Returns:
+        tuple: Items in the page and pagination information
+    """
+    if page_size < 1:
+        raise ValueError('Invalid page size')
+    if page < 1:
+        abort(404)
+    offset = (page - 1) * page_size
+    items = query.limit(page_size + 1).offset(offset).all()
+    if not items and page != 1:
+        abort(404)
+    has_next = len(items) > page_size
+    items = items[:page_size]
+
+    pagination = {'page': page, 'size': page_size}
+    if count == COUNT_NONE:
+        pagination['has_next'] = has_next
+    else:
+        if total is None and count == COUNT_ESTIMATE:
+            total = estimate_count(query)
+            pagination['estimated'] = True
+        elif total is None and not has_next:
+            # Last page: count is known without querying the database
+            total = offset + len(items)
+        elif total is None:
+            total = query.order_by(None).count()
+        pagination.update({
+            'total': total,
+            'pages': int(math.ceil(1.0 * total / page_size))})
+    return items, pagination
+
@@ -0,0 +1,378 @@
+# -*- coding: utf-8 -*-
+"""
+Long-running process that keeps Deployment.current_status in sync with the
+Kubernetes cluster. It watches (no polling) deployments and services in the
+namespace of each enabled target, keeps their state in memory and writes
+status changes to the database in batches.
+
+Usage:
+    python -m seed.reconciler
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+
+from flask_babel import gettext
+from kubernetes import client, watch
+from kubernetes.client.exceptions import ApiException
+from sqlalchemy.orm import load_only
+
+from seed import jobs
+from seed import rollouts
+from seed.k8s_crud import (DEPLOYMENT_LABEL, rollout_status,
+                           rollout_version)
+from seed.notifier import notifier
+from seed.models import (Deployment, DeploymentLog, DeploymentRollout,
+                         DeploymentStatus, DeploymentTarget,
+                         DeploymentTargetType, db)
+from seed.util import get_deployment_id
+from seed.worker import create_worker_app
+
+logger = logging.getLogger(__name__)
+
+# Server side timeout of each watch request (it is resumed afterwards)
+WATCH_TIMEOUT = 300
+# Interval between batched writes to the database
+FLUSH_INTERVAL = 2
+# Interval to look for new (or disabled) targets
+TARGETS_INTERVAL = 60
+# Wait before watching again after an error
+RETRY_INTERVAL = 5
+
+# Statuses that are updated from the cluster state. Other statuses are
+# managed by the API and jobs (e.g. a pending undeploy).
+MANAGED_STATUSES = (DeploymentStatus.DEPLOYED, DeploymentStatus.PENDING,
+                    DeploymentStatus.ERROR)
+# Statuses that finish a rollout
+ROLLOUT_STATUSES = (DeploymentStatus.DEPLOYED, DeploymentStatus.ERROR)
+
+
+class StatusChange(NamedTuple):
+    deployment_id: int
+    status: Optional[str] = None
+    message: Optional[str] = None
+    port: Optional[int] = None
+    # Version applied to the cluster (see rollouts)
+    version: Optional[int] = None
+
+
+def merge_changes(previous: StatusChange,
+                  change: StatusChange) -> StatusChange:
+    """Merges two changes of the same deployment (change is the latest).
+    Status, message and version come from the latest change with a status,
+    and the port from the latest change with a port."""
+    return StatusChange(
+        change.deployment_id,
+        change.status or previous.status,
+        change.message if change.status else previous.message,
+        change.port or previous.port,
+        change.version if change.status else previous.version)
+
+
+def apply_change(deployment: Deployment, change: StatusChange,
+                 rollout: Optional[DeploymentRollout] = None
+                 ) -> Tuple[bool, Optional[str]]:
+    """Applies the change to the deployment (not written). The status is
+    changed only if it is managed by the reconciler (MANAGED_STATUSES) or
+    if the change is for the version of the open rollout of the deployment
+    (even if it is being redeployed), which is finished.
+
+    Returns:
+        tuple: Whether the deployment changed and the message for its log
+            (None if the status did not change)
+    """
+    changed = False
+    message = None
+    finished = (rollout is not None
+                and change.status in ROLLOUT_STATUSES
+                and change.version == rollout.version)
+    if finished:
+        rollouts.finish(rollout, change.status)
+    if (change.status
+            and change.status != deployment.current_status
+            and (finished or deployment.current_status in
+                 MANAGED_STATUSES)):
+        deployment.current_status = change.status
+        message = change.message
+        if finished and rollout.time_to_ready is not None:
+            message = gettext(
+                '%(message)s Ready in %(seconds)s seconds.',
+                message=message, seconds=rollout.time_to_ready)
+        changed = True
+    if change.port and change.port != deployment.port:
+        deployment.port = change.port
+        changed = True
+    return changed, message
+
+
+class Reconciler:
+    def __init__(self, app):
+        self.app = app
+        self.changes = queue.Queue()
+        self.stopped = threading.Event()
+        # Cached state, by (namespace, name): deployment status and
+        # service node port
+        self.deployments: Dict[Tuple[str, str], str] = {}
+        self.services: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+        # Stop event of the watch threads, by (cluster URL, namespace)
+        self._watched: Dict[Tuple[str, str], threading.Event] = {}
+        # Changes taken from the queue and not written yet, by deployment
+        self._pending: Dict[int, StatusChange] = {}
+
+    def run(self) -> None:
+        """Watches the targets and writes changes until stopped"""
+        last_targets_check = 0
+        while not self.stopped.is_set():
+            if time.monotonic() - last_targets_check > TARGETS_INTERVAL:
+                self._watch_targets()
+                last_targets_check = time.monotonic()
+            self.stopped.wait(FLUSH_INTERVAL)
+            try:
+                self.flush()
+            except Exception:
+                # e.g. lost connection or deadlock. Changes are kept.
+                logger.exception('Unable to write %s change(s), retrying',
+                                 len(self._pending))
+
+    def stop(self) -> None:
+        self.stopped.set()
+        for stop in self._watched.values():
+            stop.set()
+
+    def on_deployment(self, event_type: str,
+                      obj: client.V1Deployment) -> None:
+        deployment_id = get_deployment_id(obj.metadata.name)
+        if deployment_id is None:
+            return
+        key = (obj.metadata.namespace, obj.metadata.name)
+        if event_type == 'DELETED':
+            with self._lock:
+                self.deployments.pop(key, None)
+            self.changes.put(StatusChange(
+                deployment_id, DeploymentStatus.SUSPENDED,
+                gettext('Deployment removed from the cluster.')))
+            return
+        if obj.metadata.deletion_timestamp:
+            # Being removed (undeploy)
+            status, message = DeploymentStatus.SUSPENDED, None
+        else:
+            status, message = rollout_status(obj)
+        with self._lock:
+            self.deployments[key] = status
+        # Status is compared with the database when changes are written
+        # (jobs may have changed it in the meantime)
+        if message:
+            self.changes.put(StatusChange(deployment_id, status, message,
+                                          version=rollout_version(obj)))
+
+    def on_service(self, event_type: str, obj: client.V1Service) -> None:
+        deployment_id = get_deployment_id(obj.metadata.name)
+        if deployment_id is None:
+            return
+        namespace = obj.metadata.namespace
+        key = (namespace, obj.metadata.name)
+        if event_type == 'DELETED':
+            with self._lock:
+                self.services.pop(key, None)
+                deployment_status = self.deployments.get(
+                    (namespace, 'd' + obj.metadata.name[1:]))
+            if deployment_status not in (None, DeploymentStatus.SUSPENDED):
+                self.changes.put(StatusChange(
+                    deployment_id, DeploymentStatus.ERROR,
+                    gettext('Service removed from the cluster.')))
+            return
+        node_port = next((p.node_port for p in obj.spec.ports or []
+                          if p.node_port), None)
+        with self._lock:
+            if self.services.get(key) == node_port:
+                return
+            self.services[key] = node_port
+        if node_port:
+            self.changes.put(StatusChange(deployment_id, port=node_port))
+
+    def flush(self) -> int:
+        """Writes pending changes in a single transaction. Changes to the
+        same deployment are merged, and unchanged deployments are not
+        written. If writing fails, changes are kept and written (merged
+        with newer ones) in the next flush.
+
+        Returns:
+            int: Number of updated deployments
+        """
+        while True:
+            try:
+                change = self.changes.get_nowait()
+            except queue.Empty:
+                break
+            previous = self._pending.get(change.deployment_id)
+            if previous is not None:
+                change = merge_changes(previous, change)
+            self._pending[change.deployment_id] = change
+        if not self._pending:
+            return 0
+
+        with self.app.app_context():
+            updated, users = self._write(self._pending)
+            self._pending = {}
+            for user_id in users:
+                notifier.notify(event='refresh',
+                                room=f'deployment.list.{user_id}',
+                                data={}, namespace='/stand')
+        if updated:
+            logger.info('Reconciled %s deployment(s)', updated)
+        return updated
+
+    # region Protected
+    def _write(self, pending: Dict[int, StatusChange]) -> Tuple[int, set]:
+        """Applies and commits the changes (rolled back if it fails).
+        Returns the number of updated deployments and their users."""
+        updated = 0
+        users = set()
+        try:
+            deployments = Deployment.query.options(load_only(
+                Deployment.id, Deployment.current_status, Deployment.port,
+                Deployment.user_id)).filter(
+                    Deployment.id.in_(list(pending.keys())))
+            open_rollouts = rollouts.get_open(
+                [c.deployment_id for c in pending.values()
+                 if c.status in ROLLOUT_STATUSES])
+            for deployment in deployments:
+                changed, message = apply_change(
+                    deployment, pending[deployment.id],
+                    open_rollouts.get(deployment.id))
+                if message is not None:
+                    db.session.add(DeploymentLog(
+                        status=deployment.current_status,
+                        deployment_id=deployment.id, log=message))
+                if changed:
+                    updated += 1
+                    users.add(deployment.user_id)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return updated, users
+
+    def _watch_targets(self) -> None:
+        with self.app.app_context():
+            targets = DeploymentTarget.query.filter(
+                DeploymentTarget.enabled,
+                DeploymentTarget.target_type ==
+                DeploymentTargetType.KUBERNETES).all()
+            # Targets may share the cluster and namespace
+            keys = {(t.url, t.namespace) for t in targets}
+            for key in set(self._watched) - keys:
+                # Target disabled or removed
+                logger.info('Stop watching %s', key[1])
+                self._watched.pop(key).set()
+            for target in targets:
+                key = (target.url, target.namespace)
+                if key in self._watched:
+                    continue
+                try:
+                    api = jobs.get_api(target, gettext)
+                except Exception:
+                    logger.exception('Unable to connect to target %s',
+                                     target.id)
+                    continue
+                stop = threading.Event()
+                self._watched[key] = stop
+                api_core = client.CoreV1Api(api_client=api.api_client)
+                self._start(api.list_namespaced_deployment, target.namespace,
+                            self.on_deployment, self.deployments, stop,
+                            DEPLOYMENT_LABEL)
+                self._start(api_core.list_namespaced_service,
+                            target.namespace, self.on_service, self.services,
+                            stop)
+
+    def _start(self, list_func: Callable, namespace: str,
+               handler: Callable, cache: dict, stop: threading.Event,
+               label_selector: Optional[str] = None) -> None:
+        thread = threading.Thread(
+            target=self._watch, daemon=True,
+            name=f'watch-{list_func.__name__}-{namespace}',
+            args=(list_func, namespace, handler, cache, stop,
+                  label_selector))
+        thread.start()
+
+    def _watch(self, list_func: Callable, namespace: str, handler: Callable,
+               cache: dict, stop: threading.Event,
+               label_selector: Optional[str]) -> None:
+        """Lists the objects once and watches changes, resuming from the
+        last resourceVersion, until stop is set. Lists again only if the
+        version expired."""
+        kwargs = {'label_selector': label_selector} if label_selector else {}
+        resource_version = None
+        while not stop.is_set():
+            try:
+                if resource_version is None:
+                    result = list_func(namespace, **kwargs)
+                    resource_version = result.metadata.resource_version
+                    self._sync(namespace, result.items, handler, cache)
+                w = watch.Watch()
+                for event in w.stream(list_func, namespace,
+                                      resource_version=resource_version,
+                                      timeout_seconds=WATCH_TIMEOUT,
+                                      **kwargs):
+                    if stop.is_set():
+                        # Events of a target no longer watched are ignored
+                        w.stop()
+                        break
+                    resource_version = event['object'].metadata.\
+                        resource_version
+                    handler(event['type'], event['object'])
+            except ApiException as e:
+                if e.status == 410:
+                    # resourceVersion is too old, list again
+                    resource_version = None
+                else:
+                    logger.warning('Error watching %s: %s', namespace, e)
+                    stop.wait(RETRY_INTERVAL)
+            except Exception:
+                logger.exception('Error watching %s', namespace)
+                stop.wait(RETRY_INTERVAL)
+
+    def _sync(self, namespace: str, items: list, handler: Callable,
+              cache: dict) -> None:
+        """Handles a full list: objects no longer present were deleted while
+        the process was not watching"""
+        names = set()
+        for item in items:
+            names.add(item.metadata.name)
+            handler('MODIFIED', item)
+        with self._lock:
+            removed = [k for k in cache
+                       if k[0] == namespace and k[1] not in names]
+        for _, name in removed:
+            handler('DELETED', _Removed(name, namespace))
+    # endregion
+
+
+class _Removed:
+    """Placeholder for an object removed while it was not watched"""
+    def __init__(self, name: str, namespace: str):
+        self.metadata = client.V1ObjectMeta(name=name, namespace=namespace)
+
+
+def main():
+    config_file = os.environ.get('SEED_CONFIG')
+    os.chdir(os.environ.get('SEED_HOME', '.'))
+    if not config_file:
+        logger.error('Please, set SEED_CONFIG environment variable')
+        exit(1)
+
+    # Only configuration, database and i18n are needed, not the REST API
+    reconciler = Reconciler(create_worker_app(config_file))
+    try:
+        reconciler.run()
+    except KeyboardInterrupt:
+        reconciler.stop()
+        reconciler.flush()
+
+
+if __name__ == '__main__':
+    main()
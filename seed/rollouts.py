@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+Rollout tracking. A rollout starts when a deploy job applies a version of a
+deployment to the cluster and finishes when all its replicas are available,
+recording the time to ready, or when it fails. Jobs do not wait for
+rollouts: they are finished by jobs.track_rollouts (scheduled checks) or by
+the reconciler, whichever sees the change first.
+"""
+import datetime
+from typing import Dict, List, Optional
+
+from seed.models import Deployment, DeploymentRollout, DeploymentStatus, db
+
+# Maximum time (seconds) for all replicas to become available
+ROLLOUT_DEADLINE = 600
+# Interval (seconds) between checks of a rollout, increased after each check
+CHECK_INTERVAL = 2
+MAX_CHECK_INTERVAL = 30
+
+
+def start(deployment: Deployment, replicas: int,
+          image: Optional[str]) -> DeploymentRollout:
+    """Starts the rollout of the current version of the deployment.
+    Unfinished rollouts of previous versions are abandoned (finished
+    without time to ready). Caller must commit."""
+    now = datetime.datetime.utcnow()
+    DeploymentRollout.query.filter(
+        DeploymentRollout.deployment_id == deployment.id,
+        DeploymentRollout.finished.is_(None)).update(
+            {DeploymentRollout.finished: now}, synchronize_session=False)
+    rollout = DeploymentRollout(
+        deployment_id=deployment.id, version=deployment.version,
+        replicas=replicas, image=image, started=now,
+        status=DeploymentStatus.PENDING)
+    db.session.add(rollout)
+    return rollout
+
+
+def get_open(deployment_ids: List[int]) -> Dict[int, DeploymentRollout]:
+    """Unfinished rollouts, by deployment id"""
+    if not deployment_ids:
+        return {}
+    return {r.deployment_id: r for r in DeploymentRollout.query.filter(
+        DeploymentRollout.deployment_id.in_(deployment_ids),
+        DeploymentRollout.finished.is_(None))}
+
+
+def finish(rollout: DeploymentRollout, status: str) -> None:
+    """Finishes the rollout with status DEPLOYED (time to ready is
+    recorded) or ERROR. Caller must commit."""
+    rollout.finished = datetime.datetime.utcnow()
+    rollout.status = status
+    if status == DeploymentStatus.DEPLOYED:
+        rollout.time_to_ready = round(
+            (rollout.finished - rollout.started).total_seconds(), 3)
+
+
+def is_expired(rollout: DeploymentRollout, deadline: int) -> bool:
+    return (datetime.datetime.utcnow() - rollout.started).total_seconds() \
+        > deadline
+
+
+def check_interval(check: int) -> int:
+    """Delay (seconds) before the next check of rollouts"""
+    return min(MAX_CHECK_INTERVAL, CHECK_INTERVAL * 2 ** (check - 1))
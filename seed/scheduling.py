@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+Per-target scheduling of deployment jobs. Jobs that change a single
+deployment are enqueued in the queue of its deployment target, so a slow or
+unreachable cluster only delays its own jobs. TargetWorker listens on every
+target queue, in round robin order, and skips targets that are already
+running their maximum number of jobs. Delayed jobs (retries) are enqueued
+by TargetWorker when their delay expires. Calls to the Kubernetes API are
+limited per target by ApiRateLimiter.
+
+TargetWorker runs jobs in its own process, instead of forking a work horse
+for each job, so caches kept by jobs (Kubernetes API clients, model URLs
+and translations) are reused by the next jobs. Job timeouts are still
+enforced (SIGALRM).
+"""
+import datetime
+import logging
+import time
+from typing import Dict, List, Optional
+
+from flask import current_app
+from rq import Queue, SimpleWorker
+from rq.job import Job
+from rq.registry import ScheduledJobRegistry, StartedJobRegistry
+from rq.utils import current_timestamp
+from sqlalchemy import create_engine, select
+from sqlalchemy.pool import NullPool
+
+from seed import rq
+from seed.models import DeploymentTarget
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE = 'seed'
+TARGET_QUEUE_PREFIX = 'seed.target.'
+# Limits used when the target does not define its own (None or 0:
+# unlimited)
+MAX_RUNNING_JOBS = 2
+API_RATE_LIMIT = None
+# Interval (seconds) to look for new target queues and free job slots
+REFRESH_INTERVAL = 5
+# Interval (seconds) to reload limits of targets from the database
+LIMITS_INTERVAL = 60
+
+
+def target_queue_name(target_id: int) -> str:
+    return f'{TARGET_QUEUE_PREFIX}{target_id}'
+
+
+def get_target_id(queue_name: str) -> Optional[int]:
+    """Returns the target id of a target queue (None for other queues)"""
+    if queue_name.startswith(TARGET_QUEUE_PREFIX):
+        suffix = queue_name[len(TARGET_QUEUE_PREFIX):]
+        if suffix.isdigit():
+            return int(suffix)
+    return None
+
+
+def queue_stats(connection) -> List[Dict]:
+    """Depth (queued jobs), running jobs and wait time (seconds) of the
+    oldest queued job, for the default queue and each target queue"""
+    result = []
+    now = datetime.datetime.now(datetime.timezone.utc)
+    for queue in sorted(Queue.all(connection=connection),
+                        key=lambda q: q.name):
+        target_id = get_target_id(queue.name)
+        if target_id is None and queue.name != DEFAULT_QUEUE:
+            continue
+        wait = 0
+        head = queue.get_job_ids(0, 0)
+        job = head and Job.fetch(head[0], connection=connection)
+        if job and job.enqueued_at:
+            enqueued_at = job.enqueued_at.replace(
+                tzinfo=datetime.timezone.utc)
+            wait = round((now - enqueued_at).total_seconds(), 3)
+        result.append({
+            'queue': queue.name,
+            'target_id': target_id,
+            'queued': queue.count,
+            'running': StartedJobRegistry(
+                queue.name, connection=connection).count,
+            'wait': wait,
+        })
+    return result
+
+
+class ApiRateLimiter:
+    """Limits calls to the Kubernetes API of a target to `rate` per second.
+    Calls are counted in Redis (one key per second), so the limit is shared
+    by all workers. If Redis is unavailable, calls are not limited.
+    """
+    def __init__(self, target_id: int, rate: Optional[int] = None):
+        self.target_id = target_id
+        self.rate = rate
+        self.throttled = 0
+
+    def acquire(self) -> None:
+        """Blocks until a call to the API is allowed"""
+        while self.rate:
+            now = time.time()
+            window = int(now)
+            key = f'seed:target:{self.target_id}:api:{window}'
+            try:
+                with rq.connection.pipeline() as pipe:
+                    pipe.incr(key)
+                    pipe.expire(key, 2)
+                    count = pipe.execute()[0]
+            except Exception as e:
+                logger.warning('API rate not limited for target %s: %s',
+                               self.target_id, e)
+                return
+            if count <= self.rate:
+                return
+            self.throttled += 1
+            time.sleep(window + 1 - now)
+
+
+class TargetWorker(SimpleWorker):
+    """RQ worker that, besides its queues, listens on the queues of all
+    deployment targets. Queues are served in round robin order and a target
+    queue is skipped while the target runs its maximum number of jobs
+    (DeploymentTarget.max_running_jobs). Workers do not coordinate, so
+    the limit may be exceeded briefly when they dequeue at the same time.
+    Jobs run in the worker process (no fork).
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._base_queues = list(self.queues)
+        self._last_queue = None
+        self._limits: Dict[int, Optional[int]] = {}
+        self._limits_loaded = None
+        self._engine = None
+
+    def dequeue_job_and_maintain_ttl(self, timeout, max_idle_time=None):
+        if timeout is None:
+            # Burst mode: does not wait for jobs
+            self._refresh_queues()
+            return super().dequeue_job_and_maintain_ttl(timeout,
+                                                        max_idle_time)
+        # Waits at most REFRESH_INTERVAL in each dequeue, so new target
+        # queues and freed slots are seen
+        idle_since = time.monotonic()
+        while True:
+            self._refresh_queues()
+            wait = min(timeout, REFRESH_INTERVAL)
+            if self._ordered_queues:
+                result = super().dequeue_job_and_maintain_ttl(wait, wait)
+                if result is not None:
+                    return result
+            else:
+                self.heartbeat()
+                time.sleep(wait)
+            if (max_idle_time is not None and
+                    time.monotonic() - idle_since >= max_idle_time):
+                return None
+
+    def reorder_queues(self, reference_queue: Queue) -> None:
+        self._last_queue = reference_queue.name
+
+    def teardown(self):
+        super().teardown()
+        # Events of the last jobs are sent asynchronously
+        from seed.jobs import flush_ui_events
+        flush_ui_events()
+
+    # region Protected
+    def _refresh_queues(self) -> None:
+        queues = {q.name: q for q in self._base_queues}
+        for queue in Queue.all(connection=self.connection,
+                               job_class=self.job_class,
+                               serializer=self.serializer):
+            if get_target_id(queue.name) is not None:
+                queues.setdefault(queue.name, queue)
+        names = sorted(queues)
+        if self._last_queue in queues:
+            # Round robin: starts after the last queue served
+            pos = names.index(self._last_queue) + 1
+            names = names[pos:] + names[:pos]
+
+        self.queues = [queues[name] for name in sorted(queues)]
+        for queue in self.queues:
+            self._enqueue_scheduled_jobs(queue)
+        self._ordered_queues = [queues[name] for name in names
+                                if not self._is_saturated(queues[name])]
+
+    def _enqueue_scheduled_jobs(self, queue: Queue) -> None:
+        """Enqueues jobs of the queue whose delay expired. RQ scheduler
+        handles only the queues known when the worker starts, and target
+        queues are created later. Removing the job from the registry works
+        as a lock, so only one worker enqueues it."""
+        registry = ScheduledJobRegistry(queue=queue)
+        try:
+            for job_id in registry.get_jobs_to_schedule(current_timestamp()):
+                if not self.connection.zrem(registry.key, job_id):
+                    continue
+                job = queue.fetch_job(job_id)
+                if job is not None:
+                    queue.enqueue_job(job)
+        except Exception:
+            logger.exception('Unable to enqueue scheduled jobs of %s',
+                             queue.name)
+
+    def _is_saturated(self, queue: Queue) -> bool:
+        target_id = get_target_id(queue.name)
+        if target_id is None:
+            return False
+        limit = self._get_limits().get(
+            target_id, current_app.config.get('TARGET_MAX_RUNNING_JOBS',
+                                              MAX_RUNNING_JOBS))
+        if not limit:
+            return False
+        running = StartedJobRegistry(queue.name,
+                                     connection=self.connection).count
+        return running >= limit
+
+    def _get_limits(self) -> Dict[int, Optional[int]]:
+        """Maximum of running jobs per target, reloaded every
+        LIMITS_INTERVAL seconds. A connection without pool is used, so it is
+        not kept open (or shared with jobs) between reloads."""
+        if (self._limits_loaded is not None and
+                time.monotonic() - self._limits_loaded < LIMITS_INTERVAL):
+            return self._limits
+        self._limits_loaded = time.monotonic()
+        default = current_app.config.get('TARGET_MAX_RUNNING_JOBS',
+                                         MAX_RUNNING_JOBS)
+        try:
+            if self._engine is None:
+                self._engine = create_engine(
+                    current_app.config['SQLALCHEMY_DATABASE_URI'],
+                    poolclass=NullPool)
+            with self._engine.connect() as connection:
+                rows = connection.execute(select(
+                    DeploymentTarget.id, DeploymentTarget.max_running_jobs))
+                self._limits = {
+                    target_id: default if limit is None else limit
+                    for target_id, limit in rows}
+        except Exception:
+            logger.exception('Unable to load limits of targets')
+        return self._limits
+    # endregion
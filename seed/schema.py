@@ -2,13 +2,34 @@
 import datetime
 import json
 from copy import deepcopy
+from functools import lru_cache
 from marshmallow import Schema, fields, post_load, post_dump, EXCLUDE, INCLUDE
 from marshmallow.validate import OneOf
 from flask_babel import gettext
 from seed.models import *
 
 
+SCHEMA_CACHE_SIZE = 256
+
+
+@lru_cache(maxsize=SCHEMA_CACHE_SIZE)
+def _cached_schema(schema_cls, only, many):
+    return schema_cls(many=many, only=only)
+
+
+def get_schema(schema_cls, many=False, only=None):
+    """ Returns a shared instance of schema_cls for the projection (only) and
+    cardinality (many). Fields are bound once per projection, instead of once
+    per request. Instances must be used only to dump/load, never changed.
+    """
+    if only is not None:
+        only = tuple(sorted(set(only)))
+    return _cached_schema(schema_cls, only, many)
+
+
+@lru_cache(maxsize=SCHEMA_CACHE_SIZE)
 def partial_schema_factory(schema_cls):
+    """ Returns a shared schema accepting partial data (nested included) """
     schema = schema_cls(partial=True)
     for field_name, field in list(schema.fields.items()):
         if isinstance(field, fields.Nested):
@@ -534,6 +555,30 @@ class DeploymentMetricItemResponseSchema(BaseSchema):
         unknown = EXCLUDE
 
 
+class DeploymentRolloutListResponseSchema(BaseSchema):
+    """ JSON serialization schema """
+    id = fields.Integer(required=True)
+    deployment_id = fields.Integer(required=True)
+    version = fields.Integer(required=True)
+    replicas = fields.Integer(required=True)
+    image = fields.String(required=False, allow_none=True)
+    started = fields.DateTime(required=True)
+    finished = fields.DateTime(required=False, allow_none=True)
+    time_to_ready = fields.Float(required=False, allow_none=True)
+    status = fields.String(required=True,
+                           validate=[OneOf(list(DeploymentStatus.__dict__.keys()))])
+
+    # noinspection PyUnresolvedReferences
+    @post_load
+    def make_object(self, data, **kwargs):
+        """ Deserialize data into an instance of DeploymentRollout"""
+        return DeploymentRollout(**data)
+
+    class Meta:
+        ordered = True
+        unknown = EXCLUDE
+
+
 class DeploymentTargetCreateRequestSchema(BaseSchema):
     """ JSON serialization schema """
     name = fields.String(required=True)
@@ -548,6 +593,8 @@ class DeploymentTargetCreateRequestSchema(BaseSchema):
     target_type = fields.String(required=True,
                                 validate=[OneOf(list(DeploymentTargetType.__dict__.keys()))])
     descriptor = fields.String(required=False, allow_none=True)
+    max_running_jobs = fields.Integer(required=False, allow_none=True)
+    api_rate_limit = fields.Integer(required=False, allow_none=True)
 
     # noinspection PyUnresolvedReferences
     @post_load
@@ -592,6 +639,8 @@ class DeploymentTargetItemResponseSchema(BaseSchema):
     base_service_url = fields.String(required=True)
     target_type = fields.String(required=True,
                                 validate=[OneOf(list(DeploymentTargetType.__dict__.keys()))])
+    max_running_jobs = fields.Integer(required=False, allow_none=True)
+    api_rate_limit = fields.Integer(required=False, allow_none=True)
 
     # noinspection PyUnresolvedReferences
     @post_load
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""
+Configuration shared by the web application (seed.app) and the lightweight
+worker (seed.worker).
+"""
+import yaml
+
+from seed import rq
+from seed.models import db
+
+
+def load_config(config_file: str) -> dict:
+    """Reads the seed section of the configuration file (SEED_CONFIG)"""
+    with open(config_file) as f:
+        return yaml.load(f, Loader=yaml.FullLoader)['seed']
+
+
+def configure_app(app, config: dict) -> None:
+    """Sets database, RQ and i18n options and initializes database and RQ
+    extensions. Options in the config section override the defaults."""
+    server_config = config.get('servers', {})
+    app.config['SQLALCHEMY_DATABASE_URI'] = server_config.get(
+        'database_url')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_POOL_SIZE'] = 10
+    app.config['SQLALCHEMY_POOL_RECYCLE'] = 240
+
+    app.config['RQ_REDIS_URL'] = config['servers']['redis_url']
+    # Listens also on the queues of deployment targets (seed.scheduling)
+    app.config['RQ_WORKER_CLASS'] = 'seed.scheduling.TargetWorker'
+
+    app.config['BABEL_TRANSLATION_DIRECTORIES'] = 'i18n/locales'
+    app.config['BABEL_DEFAULT_LOCALE'] = 'UTC'
+
+    app.config.update(config.get('config', {}))
+    app.config['SEED_CONFIG'] = config
+
+    db.init_app(app)
+    rq.init_app(app)
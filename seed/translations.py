@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+Translations loaded once per locale and shared by jobs and the API. Jobs
+translate messages without a Flask request context.
+"""
+import os
+from functools import lru_cache
+from typing import Callable
+
+from babel import support
+from flask_babel import Babel, Domain, get_locale
+
+# Same directory as BABEL_TRANSLATION_DIRECTORIES (relative to seed package)
+TRANSLATION_DIRECTORY = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'i18n', 'locales')
+DOMAIN = 'messages'
+
+
+@lru_cache(maxsize=32)
+def _load(directory: str, locale: str) -> support.NullTranslations:
+    # Returns NullTranslations (messages are not translated) if there is no
+    # compiled catalog for the locale
+    return support.Translations.load(directory, [locale], DOMAIN)
+
+
+def get_translations(locale: str) -> support.NullTranslations:
+    """Compiled catalog for the locale (cached)"""
+    return _load(TRANSLATION_DIRECTORY, str(locale))
+
+
+def get_gettext(locale: str) -> Callable:
+    """Returns a gettext function bound to the locale"""
+    translations = get_translations(locale)
+
+    def gettext(msg, **variables):
+        s = translations.ugettext(msg)
+        return s if not variables else s % variables
+
+    return gettext
+
+
+class CachedDomain(Domain):
+    """Flask-Babel domain that uses the translations cached by this module,
+    so the API and jobs share the loaded catalogs"""
+    def __init__(self):
+        super().__init__(domain=DOMAIN)
+
+    def get_translations(self):
+        return get_translations(str(get_locale()))
+
+
+def create_babel(app) -> Babel:
+    babel = Babel(app)
+    # Translations are shared with jobs
+    babel.domain_instance = CachedDomain()
+    return babel
@@ -1,6 +1,14 @@
+import datetime
+import hashlib
 import re
+from typing import Dict, List, Optional
+
+from flask import Response, request, stream_with_context
 from flask_babel import gettext
+from sqlalchemy.orm import load_only
+from werkzeug.http import http_date, parse_date
 
+from seed.encoding import dumps
 from seed.models import Deployment
 
 def translate_validation(validation_errors):
@@ -8,10 +16,116 @@ def translate_validation(validation_errors):
         validation_errors[field] = [gettext(error) for error in errors]
     return validation_errors
 
+NDJSON_MIMETYPE = 'application/x-ndjson'
+NDJSON_BATCH_SIZE = 500
+
 # Used to create a valid subdomain name
 _subdomain_regex = re.compile('[0-9]*[^A-Za-z0-9\\-]')
+# Names of Kubernetes deployments (d-) and services (s-) created by Seed
+_internal_name_regex = re.compile(r'^[ds]-(\d+)-')
 
 def get_internal_name(deployment: Deployment) -> str:
     sub_domain =_subdomain_regex.sub('', (deployment.name or '').lower())
     # Size limit is 63 (Kubernetes follows RFC 1123)
-    return (f'd-{deployment.id}-{sub_domain}')[:63]
\ No newline at end of file
+    return (f'd-{deployment.id}-{sub_domain}')[:63]
+
+
+def get_deployment_id(internal_name: str) -> Optional[int]:
+    """Id of the deployment, given the name of a Kubernetes deployment or
+    service created by Seed (None if the name was not created by Seed)"""
+    match = _internal_name_regex.match(internal_name or '')
+    return int(match.group(1)) if match else None
+
+
+def load_only_fields(query, model, only: Optional[List[str]],
+                     dependencies: Optional[Dict[str, List[str]]] = None,
+                     extra: Optional[List[str]] = None):
+    """Restricts the columns loaded by query to the ones required to
+    serialize the fields in `only`. Remaining columns are deferred, so large
+    (LONGTEXT) columns are not read when the client does not ask for them.
+
+    Args:
+        query: SQLAlchemy query
+        model: Mapped class
+        only (list): Names of the fields requested by the client. If None,
+            the query is not changed
+        dependencies (dict): Columns required by fields that are not columns
+            (e.g. fields.Function or fields.Nested)
+        extra (list): Columns always loaded (e.g. sort column)
+    """
+    if not only:
+        return query
+    dependencies = dependencies or {}
+    column_names = model.__mapper__.columns.keys()
+    names = set(extra or [])
+    names.update(column.key for column in model.__mapper__.primary_key)
+    for field in only:
+        name = field.split('.')[0]
+        names.update(dependencies.get(name, [name]))
+    attrs = [getattr(model, name) for name in sorted(names)
+             if name in column_names]
+    return query.options(load_only(*attrs))
+
+
+def wants_ndjson() -> bool:
+    """Checks if the client asked for newline delimited JSON, using either
+    the parameter format=ndjson or the Accept header.
+    """
+    if request.args.get('format') == 'ndjson':
+        return True
+    return request.accept_mimetypes.best_match(
+        ['application/json', NDJSON_MIMETYPE]) == NDJSON_MIMETYPE
+
+
+def ndjson_response(query, schema,
+                    batch_size: int = NDJSON_BATCH_SIZE) -> Response:
+    """Streams the rows of query, one JSON document per line. Rows are
+    fetched in batches (yield_per), so memory usage does not depend on the
+    number of rows exported.
+
+    Args:
+        query: SQLAlchemy query
+        schema: Marshmallow schema used to dump a single row (many=False)
+        batch_size (int): Number of rows fetched from database per batch
+    """
+    def generate():
+        for row in query.yield_per(batch_size):
+            yield dumps(schema.dump(row)) + b'\n'
+
+    return Response(stream_with_context(generate()),
+                    mimetype=NDJSON_MIMETYPE)
+
+
+def conditional_headers(last_modified: Optional[datetime.datetime],
+                        *parts) -> Dict[str, str]:
+    """Builds the validators (ETag and Last-Modified) of a response.
+    The ETag also depends on the query string, because it changes the
+    response (fields, sort, page, etc).
+
+    Args:
+        last_modified (datetime): Last change in the data (UTC)
+        parts: Other values identifying the version of the data
+    """
+    key = repr((last_modified, parts, request.query_string))
+    headers = {'ETag': '"{}"'.format(
+        hashlib.sha1(key.encode('utf8')).hexdigest())}
+    if last_modified is not None:
+        headers['Last-Modified'] = http_date(
+            last_modified.replace(tzinfo=datetime.timezone.utc))
+    return headers
+
+
+def not_modified(headers: Dict[str, str]) -> Optional[Response]:
+    """Returns a 304 response if the client copy is still valid, according
+    to the If-None-Match or, if absent, the If-Modified-Since header.
+    """
+    if request.if_none_match:
+        valid = request.if_none_match.contains_weak(
+            headers['ETag'].strip('"'))
+    elif request.if_modified_since and 'Last-Modified' in headers:
+        valid = request.if_modified_since >= parse_date(
+            headers['Last-Modified'])
+    else:
+        valid = False
+    return Response(status=304, headers=headers) if valid else None
+
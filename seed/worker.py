@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+RQ worker that builds only what jobs need (configuration, database, RQ and
+i18n), instead of the web application (seed.app) with all REST resources.
+
+Usage:
+    python -m seed.worker [--burst] [queue ...]
+"""
+import argparse
+import logging
+import os
+
+from flask import Flask
+
+from seed import rq
+from seed.settings import configure_app, load_config
+from seed.translations import create_babel
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE = 'seed'
+
+
+def create_worker_app(config_file: str) -> Flask:
+    # Root path is the seed package, as in the web application
+    app = Flask('seed')
+    configure_app(app, load_config(config_file))
+    create_babel(app)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('queues', nargs='*', default=[DEFAULT_QUEUE],
+                        help='Queues to listen on')
+    parser.add_argument('--burst', action='store_true',
+                        help='Quit after all jobs are done')
+    parser.add_argument('--logging-level', default='INFO')
+    args = parser.parse_args()
+
+    config_file = os.environ.get('SEED_CONFIG')
+    os.chdir(os.environ.get('SEED_HOME', '.'))
+    if not config_file:
+        logger.error('Please, set SEED_CONFIG environment variable')
+        exit(1)
+
+    app = create_worker_app(config_file)
+    # Job functions are imported once, before the first job
+    from seed import jobs  # noqa: F401
+
+    # Jobs (FlaskJob) use the current application instead of loading
+    # FLASK_APP (seed.app)
+    with app.app_context():
+        worker = rq.get_worker(*args.queues)
+        worker.work(burst=args.burst, logging_level=args.logging_level)
+
+
+if __name__ == '__main__':
+    main()
@@ -38,3 +38,136 @@ def test_post_deployment_invalid_form(client):
     
     assert rv.status_code == 400
 
+
+def _add_deployments(app, targets, per_target):
+    """Adds deployments, each target with its own image. Returns the ids of
+    the deployments by target id."""
+    from seed.models import DeploymentImage, DeploymentTarget
+    result = {}
+    with app.app_context():
+        for i in range(targets):
+            target = DeploymentTarget(
+                name=f'target {i}', namespace='seed', volume_path='/',
+                url='http://k8s', enabled=True, port=8080,
+                base_service_url='http://seed', target_type='KUBERNETES')
+            image = DeploymentImage(description=f'image {i}', name='seed',
+                                    tag=str(i), enabled=True)
+            deployments = [Deployment(
+                name=f'deployment {i}.{j}', version=1, model_name='model',
+                user_id=1, user_login='admin', user_name='Admin',
+                enabled=True, current_status='SAVED', type='MODEL',
+                target=target, image=image) for j in range(per_target)]
+            db.session.add_all(deployments)
+            db.session.flush()
+            result[target.id] = [d.id for d in deployments]
+        db.session.commit()
+    return result
+
+
+def test_list_deployments_query_count_does_not_depend_on_page_size(client):
+    from sqlalchemy import event
+    from seed.models import db
+    headers = {'X-Auth-Token': str(client.secret)}
+    # Each deployment with its own target and image, so lazy loading would
+    # run a query per deployment
+    _add_deployments(client.application, 20, 1)
+    statements = []
+
+    def count(*args):
+        statements.append(args[2])
+
+    with client.application.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        counts = []
+        for size in (1, 20):
+            del statements[:]
+            rv = client.get(f'/deployments?size={size}&fields=id,target,image',
+                            headers=headers)
+            assert rv.status_code == 200
+            assert len(rv.json['data']) == size
+            assert all(d['target'] and d['image'] for d in rv.json['data'])
+            counts.append(len(statements))
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+
+    # Validators (including the total count) and page query; target and
+    # image are loaded in the page query
+    assert counts == [2, 2]
+
+
+@pytest.mark.parametrize('params', ['size=0', 'size=-1&cursor=',
+                                    'size=ten&page=2'])
+def test_list_deployments_with_invalid_page_size(client, params):
+    headers = {'X-Auth-Token': str(client.secret)}
+    rv = client.get(f'/deployments?{params}', headers=headers)
+    assert rv.status_code == 400
+    assert rv.json == {'status': 'ERROR', 'message': 'Invalid page size.'}
+
+
+def test_list_deployments_as_ndjson(client):
+    headers = {'X-Auth-Token': str(client.secret),
+               'Accept': 'application/x-ndjson'}
+    rv = client.get('/deployments?fields=id,name', headers=headers)
+    assert rv.status_code == 200
+    assert rv.mimetype == 'application/x-ndjson'
+    for line in rv.data.decode('utf8').splitlines():
+        assert set(json.loads(line).keys()) <= {'id', 'name'}
+
+
+def test_get_deployment_not_modified(client):
+    headers = {'X-Auth-Token': str(client.secret)}
+    rv = client.get('/deployments/101', headers=headers)
+    assert rv.status_code == 200
+    etag = rv.headers['ETag']
+
+    rv = client.get('/deployments/101',
+                    headers=dict(headers, **{'If-None-Match': etag}))
+    assert rv.status_code == 304
+    assert rv.data == b''
+
+
+def test_batch_is_not_applied_if_any_item_is_invalid(client):
+    headers = {'X-Auth-Token': str(client.secret)}
+    data = [{'id': 101, 'description': 'changed'}, {'name': 'incomplete'}]
+    rv = client.post('/deployments/batch', headers=headers, json=data)
+
+    assert rv.status_code == 400
+    assert [r['status'] for r in rv.json['data']] == ['OK', 'ERROR']
+    assert 'model_name' in rv.json['data'][1]['errors']
+
+
+def test_bulk_deploy_requires_existing_deployments(client):
+    headers = {'X-Auth-Token': str(client.secret)}
+    rv = client.post('/deployments/deploy', headers=headers,
+                     json={'ids': [101, 99999]})
+    assert rv.status_code == 404
+    assert rv.json['status'] == 'ERROR'
+
+    rv = client.post('/deployments/deploy', headers=headers, json={})
+    assert rv.status_code == 400
+
+
+def test_bulk_deploy_enqueues_a_job_per_target(client, monkeypatch):
+    from seed import deployment_api
+    from seed.scheduling import target_queue_name
+    headers = {'X-Auth-Token': str(client.secret)}
+    enqueued = []
+    monkeypatch.setattr(deployment_api, 'enqueue_deployment_jobs',
+                        lambda job_datas, superseded: enqueued.extend(
+                            job_datas))
+    by_target = _add_deployments(client.application, 2, 2)
+    ids = [i for target_ids in by_target.values() for i in target_ids]
+
+    rv = client.post('/deployments/deploy', headers=headers,
+                     json={'ids': ids})
+    assert rv.status_code == 200
+    assert {queue_name: job_data.args[0]
+            for queue_name, job_data in enqueued} == {
+        target_queue_name(target_id): target_ids
+        for target_id, target_ids in by_target.items()}
+    execution_ids = {d['id']: d['execution_id'] for d in rv.json['data']}
+    for (queue_name, job_data), target_ids in zip(enqueued,
+                                                  by_target.values()):
+        assert {execution_ids[i] for i in target_ids} == {job_data.job_id}
@@ -0,0 +1,90 @@
+from flask import Flask
+from kubernetes.client.exceptions import ApiException
+
+from seed import jobs, rollouts, rq
+from seed.models import Deployment, DeploymentTarget
+
+
+def test_job_is_superseded_by_newer_version():
+    deployment = Deployment(id=1, version=3)
+    assert jobs._is_superseded(deployment, 2)
+    assert not jobs._is_superseded(deployment, 3)
+    # Jobs enqueued without version (before coalescing) always run
+    assert not jobs._is_superseded(deployment, None)
+    assert not jobs._is_superseded(None, 2)
+
+
+def test_retry_delay_honors_retry_after():
+    e = ApiException(status=429)
+    e.headers = {'Retry-After': '120'}
+    assert jobs.is_transient(e)
+    assert jobs.retry_delay(e, 1) >= 120
+    assert not jobs.is_transient(ApiException(status=422))
+    # Jitter: never more than the exponential backoff
+    assert 0 <= jobs.retry_delay(ApiException(status=503), 3) <= \
+        jobs.RETRY_BASE_DELAY * 2 ** 3
+
+
+def test_rollout_check_interval():
+    assert [rollouts.check_interval(c) for c in (1, 2, 3)] == [2, 4, 8]
+    assert rollouts.check_interval(10) == rollouts.MAX_CHECK_INTERVAL
+
+
+def test_api_client_is_reused_until_target_changes(monkeypatch):
+    monkeypatch.setattr(jobs.os.path, 'exists', lambda path: False)
+    monkeypatch.delenv('KUBERNETES_SERVICE_HOST', raising=False)
+    monkeypatch.setattr(jobs, '_api_clients', {})
+    target = DeploymentTarget(id=1, url='https://k8s:6443',
+                              authentication_info='{"token": "a"}',
+                              api_rate_limit=10)
+
+    api_client = jobs.get_api(target, None).api_client
+    assert jobs.get_api(target, None).api_client is api_client
+    assert api_client.rate_limiter.rate == 10
+
+    # New credentials: a new client replaces the old one
+    target.authentication_info = '{"token": "b"}'
+    new_client = jobs.get_api(target, None).api_client
+    assert new_client is not api_client
+    assert list(jobs._api_clients.values()) == [new_client]
+
+    jobs.invalidate_api_client(target.id)
+    assert jobs._api_clients == {}
+
+
+class _FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    def exists(self, key):
+        return key in self.data
+
+    def set(self, key, value, ex=None):
+        self.data[key] = (value, ex)
+
+
+def test_node_ports_are_reconciled_once_per_interval(monkeypatch):
+    connection = _FakeRedis()
+    monkeypatch.setattr(rq, '_connection', connection)
+    monkeypatch.setattr(jobs, 'get_node_ports', lambda api: {30001})
+    calls = []
+    monkeypatch.setattr(jobs.node_ports, 'reconcile',
+                        lambda target_id, ports: calls.append(target_id))
+    target = DeploymentTarget(id=3)
+    with Flask(__name__).app_context():
+        # Other workers see the marker, so they do not list services again
+        jobs._reconcile_node_ports(target, None)
+        jobs._reconcile_node_ports(target, None)
+    assert calls == [3]
+    assert connection.data == {'seed:target:3:node-ports-reconciled': (
+        1, jobs.NODE_PORTS_RECONCILE_INTERVAL)}
+
+
+def test_models_are_copied_for_pool_threads():
+    deployment = Deployment(id=1, name='model', port=31000, version=2)
+    copy = jobs._copy_model(deployment)
+    assert not isinstance(copy, Deployment)
+    assert (copy.id, copy.name, copy.port, copy.version) == (
+        1, 'model', 31000, 2)
+    # Relationships are not copied (they would be loaded by the thread)
+    assert not hasattr(copy, 'target')
@@ -0,0 +1,140 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+from kubernetes import client
+
+from seed import k8s_crud
+from seed.k8s_crud import (DEPLOYMENT_LABEL, SPEC_HASH_ANNOTATION,
+                           ModelUrlResolver, create_deployment, diff,
+                           spec_hash)
+
+
+def _manifest(version, replicas=1):
+    return {'metadata': {'name': 'd-7-model',
+                         'labels': {DEPLOYMENT_LABEL: str(version)}},
+            'spec': {'replicas': replicas}}
+
+
+def test_spec_hash_ignores_version_label():
+    service = {'spec': {'ports': [{'nodePort': 31000}]}}
+    assert spec_hash({'deployment': _manifest(1), 'service': service}) == \
+        spec_hash({'deployment': _manifest(2), 'service': service})
+    assert spec_hash({'deployment': _manifest(1), 'service': service}) != \
+        spec_hash({'deployment': _manifest(1, 2), 'service': service})
+    assert spec_hash({'deployment': _manifest(1), 'service': service}) != \
+        spec_hash({'deployment': _manifest(1), 'service': {}})
+
+
+def test_diff_compares_only_fields_in_manifest():
+    current = _manifest(1)
+    current['spec']['strategy'] = {'type': 'RollingUpdate'}
+    current['status'] = {'replicas': 1}
+    assert diff(current, _manifest(1)) == []
+    assert diff(current, _manifest(2, 3)) == [
+        {'path': f'metadata.labels.{DEPLOYMENT_LABEL}',
+         'current': '1', 'new': '2'},
+        {'path': 'spec.replicas', 'current': 1, 'new': 3}]
+    assert diff(None, {'a': 1}) == [
+        {'path': '', 'current': None, 'new': {'a': 1}}]
+
+
+def test_model_url_is_cached():
+    resolver = ModelUrlResolver(ttl=60)
+    calls = []
+    resolver._fetch = lambda model_id, config: calls.append(model_id) or \
+        f'hdfs://models/{model_id}'
+    config = {'timeout': (1, 5)}
+    assert resolver._resolve(3, config) == 'hdfs://models/3'
+    assert resolver._resolve(3, config) == 'hdfs://models/3'
+    assert calls == [3]
+    assert resolver.stats() == {'hits': 1, 'misses': 1, 'size': 1}
+
+
+def test_concurrent_lookups_are_coalesced():
+    resolver = ModelUrlResolver(ttl=60)
+    calls = []
+    started = threading.Event()
+
+    def fetch(model_id, config):
+        calls.append(model_id)
+        started.set()
+        time.sleep(0.2)
+        return f'hdfs://models/{model_id}'
+
+    resolver._fetch = fetch
+    config = {'timeout': (1, 5)}
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        first = executor.submit(resolver._resolve, 3, config)
+        started.wait(1)
+        others = [executor.submit(resolver._resolve, 3, config)
+                  for _ in range(3)]
+        urls = [f.result() for f in [first] + others]
+    assert urls == ['hdfs://models/3'] * 4
+    assert calls == [3]
+
+
+class _FakeAppsApi:
+    """AppsV1Api keeping a single deployment (metadata only)"""
+    def __init__(self):
+        self.api_client = client.ApiClient()
+        self.metadata = None
+        self.calls = []
+
+    def read_namespaced_deployment(self, name, namespace):
+        if self.metadata is None:
+            raise client.ApiException(status=404)
+        return SimpleNamespace(metadata=SimpleNamespace(
+            labels=dict(self.metadata.get('labels') or {}),
+            annotations=dict(self.metadata.get('annotations') or {})))
+
+    def create_namespaced_deployment(self, body, namespace):
+        self.calls.append('create')
+        self.metadata = body['metadata']
+
+    def patch_namespaced_deployment(self, name, body, namespace):
+        self.calls.append('patch')
+        for key in ('labels', 'annotations'):
+            values = dict(self.metadata.get(key) or {},
+                          **body['metadata'].get(key, {}))
+            self.metadata[key] = {k: v for k, v in values.items()
+                                  if v is not None}
+
+
+def test_failed_deploy_is_fully_applied_when_retried(monkeypatch):
+    services = []
+
+    def create_service(*args, **kwargs):
+        services.append(args[0])
+        if len(services) == 1:
+            raise client.ApiException(status=503)
+
+    monkeypatch.setattr(k8s_crud, 'create_service', create_service)
+    monkeypatch.setattr(k8s_crud, '_get_model_url',
+                        lambda model_id: 'hdfs://models/1')
+    deployment = SimpleNamespace(
+        id=7, internal_name='d-7-model', version=1, replicas=1, model_id=1,
+        port=31000, request_cpu='1', request_memory='1Gi', limit_cpu='1',
+        limit_memory='1Gi')
+    image = SimpleNamespace(name='seed/model', tag='latest')
+    target = SimpleNamespace(namespace='seed', port=80, descriptor=None)
+    api = _FakeAppsApi()
+
+    with pytest.raises(client.ApiException):
+        create_deployment(deployment, image, target, api)
+    assert SPEC_HASH_ANNOTATION not in api.metadata.get('annotations', {})
+
+    # Retry applies the service again, then records the hash
+    create_deployment(deployment, image, target, api)
+    assert services == ['d-7-model', 'd-7-model']
+    assert SPEC_HASH_ANNOTATION in api.metadata['annotations']
+
+    # Unchanged manifest: only the version label is patched
+    api.calls.clear()
+    deployment.version = 2
+    create_deployment(deployment, image, target, api)
+    assert services == ['d-7-model', 'd-7-model']
+    assert api.calls == ['patch']
+    assert api.metadata['labels'][DEPLOYMENT_LABEL] == '2'
@@ -0,0 +1,43 @@
+import pytest
+
+from seed import manifests
+
+DESCRIPTOR = '''
+apiVersion: apps/v1
+kind: Deployment
+spec:
+  replicas: {{ replicas }}
+  template:
+    spec:
+      nodeSelector: {disk: ssd}
+      containers:
+      - name: {{ name }}
+        image: {{ image|tojson }}
+---
+apiVersion: autoscaling/v1
+kind: HorizontalPodAutoscaler
+spec: {maxReplicas: {{ replicas * 2 }}}
+'''
+
+
+def test_render_descriptor():
+    result = manifests.render(DESCRIPTOR, {
+        'name': 'd-7-model', 'replicas': 2, 'image': 'seed/model:1'})
+    assert sorted(result) == ['autoscaler', 'deployment']
+    container = result['deployment']['spec']['template']['spec'][
+        'containers'][0]
+    assert container == {'name': 'd-7-model', 'image': 'seed/model:1'}
+    assert result['autoscaler']['spec']['maxReplicas'] == 4
+    assert manifests.compile_template(DESCRIPTOR) is \
+        manifests.compile_template(DESCRIPTOR)
+
+
+@pytest.mark.parametrize('descriptor', [
+    'kind: Deployment\nspec: {{ undefined_variable }}',
+    'kind: Deployment\nspec: {% if %}',
+    'kind: Service\nspec: {}',
+    'kind: Deployment\n---\nkind: Pod',
+])
+def test_invalid_descriptor(descriptor):
+    with pytest.raises(manifests.ManifestError):
+        manifests.render(descriptor, {})
@@ -0,0 +1,54 @@
+from .conftest import *
+from seed import node_ports
+from seed.models import Deployment, NodePortAllocation, db
+
+
+def test_released_port_is_reused(client):
+    with client.application.app_context():
+        deployment = Deployment.query.get(101)
+        target_id = deployment.target_id
+        node_ports.reconcile(target_id, [node_ports.START_PORT + 1])
+
+        deployment.port = None
+        port = node_ports.allocate(deployment)
+        assert port == node_ports.START_PORT + 2
+        # Allocation is kept while deployed
+        assert node_ports.allocate(deployment) == port
+
+        node_ports.release(deployment.id)
+        db.session.commit()
+        allocation = NodePortAllocation.query.filter_by(
+            target_id=target_id, port=port).one()
+        assert allocation.free and allocation.deployment_id is None
+
+        assert node_ports.allocate(deployment) == port
+        node_ports.release(deployment.id)
+        db.session.commit()
+
+
+def test_conflicting_port_is_not_tried_again(client, monkeypatch):
+    from sqlalchemy.exc import IntegrityError
+    tried = []
+    insert = node_ports._insert
+
+    def conflicting_insert(target_id, port, deployment_id):
+        # Another worker reserved the port, but this transaction does not
+        # see it (REPEATABLE READ)
+        tried.append(port)
+        if len(tried) == 1:
+            raise IntegrityError('INSERT', {}, Exception('Duplicate entry'))
+        return insert(target_id, port, deployment_id)
+
+    monkeypatch.setattr(node_ports, '_insert', conflicting_insert)
+    with client.application.app_context():
+        deployment = Deployment.query.get(101)
+        node_ports.release(deployment.id)
+        db.session.commit()
+        NodePortAllocation.query.filter_by(
+            target_id=deployment.target_id, free=True).delete()
+        deployment.port = None
+
+        port = node_ports.allocate(deployment)
+        assert tried == [port - 1, port]
+        node_ports.release(deployment.id)
+        db.session.commit()
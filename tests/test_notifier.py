@@ -0,0 +1,21 @@
+from flask import Flask
+
+from seed.notifier import UiNotifier
+
+
+def test_refresh_events_are_coalesced_and_queue_is_bounded():
+    app = Flask(__name__)
+    app.config['SEED_CONFIG'] = {
+        'services': {'stand': {'url': 'http://localhost:1', 'auth_token': 1}}}
+    # Long window: nothing is sent during the test
+    notifier = UiNotifier(max_size=2, window=60)
+    with app.app_context():
+        for _ in range(3):
+            notifier.notify(event='refresh', room='deployment.list.1')
+        notifier.notify(event='update', room='deployment.list.1')
+        notifier.notify(event='update', room='deployment.list.1')
+
+    stats = notifier.stats()
+    assert stats['coalesced'] == 2
+    assert stats['pending'] == 2
+    assert stats['dropped'] == 1
@@ -0,0 +1,47 @@
+import datetime
+
+import pytest
+
+from seed.models import Deployment
+from seed.pagination import (DEFAULT_PAGE_SIZE, decode_cursor,
+                             encode_cursor, get_count_strategy,
+                             get_page_size, keyset_paginate, paginate)
+
+
+def test_cursor_round_trip():
+    updated = datetime.datetime(2022, 2, 10, 12, 7, 10)
+    token = encode_cursor('updated', False, [updated, 42])
+    assert decode_cursor(token, Deployment.updated, 'updated', False) == [
+        updated, 42]
+
+
+def test_cursor_for_another_sort_is_rejected():
+    token = encode_cursor('name', True, ['model', 42])
+    with pytest.raises(ValueError):
+        decode_cursor(token, Deployment.name, 'name', False)
+    with pytest.raises(ValueError):
+        decode_cursor('not-a-cursor', Deployment.name, 'name', True)
+
+
+def test_invalid_count_strategy_falls_back_to_exact():
+    assert get_count_strategy('none') == 'none'
+    assert get_count_strategy('estimate') == 'estimate'
+    assert get_count_strategy('approximate') == 'exact'
+    assert get_count_strategy(None) == 'exact'
+
+
+def test_page_size_must_be_a_positive_integer():
+    assert get_page_size(None) == DEFAULT_PAGE_SIZE
+    assert get_page_size('5') == 5
+    assert get_page_size('0') is None
+    assert get_page_size('-1') is None
+    assert get_page_size('ten') is None
+
+
+@pytest.mark.parametrize('size', [0, -1])
+def test_page_size_is_checked_by_pagination(size):
+    with pytest.raises(ValueError):
+        keyset_paginate(None, Deployment.id, Deployment.id, 'id', True,
+                        size, None)
+    with pytest.raises(ValueError):
+        paginate(None, 1, size)
@@ -0,0 +1,155 @@
+import datetime
+from types import SimpleNamespace
+
+import pytest
+from flask import Flask
+from kubernetes import client
+from sqlalchemy.exc import OperationalError
+
+from seed.k8s_crud import DEPLOYMENT_LABEL, rollout_version
+from seed import reconciler
+from seed.models import Deployment, DeploymentRollout, DeploymentStatus
+from seed.reconciler import (Reconciler, StatusChange, apply_change,
+                             merge_changes, rollout_status)
+from seed.translations import create_babel
+from seed.util import get_deployment_id
+
+
+def _deployment(available, reason='ReplicaSetUpdated'):
+    return client.V1Deployment(
+        metadata=client.V1ObjectMeta(name='d-7-model', generation=2),
+        spec=client.V1DeploymentSpec(replicas=2, selector={}, template={}),
+        status=client.V1DeploymentStatus(
+            observed_generation=2, replicas=2, updated_replicas=2,
+            available_replicas=available,
+            conditions=[
+                client.V1DeploymentCondition(
+                    type='Progressing', status='True', reason=reason),
+                client.V1DeploymentCondition(
+                    type='Available', status=str(available == 2),
+                    message='Deployment does not have minimum availability.')
+            ]))
+
+
+def test_rollout_status():
+    assert rollout_status(_deployment(1))[0] == DeploymentStatus.PENDING
+    assert rollout_status(_deployment(2))[0] == DeploymentStatus.DEPLOYED
+    assert rollout_status(_deployment(
+        0, 'NewReplicaSetAvailable'))[0] == DeploymentStatus.ERROR
+    assert rollout_status(_deployment(
+        1, 'ProgressDeadlineExceeded'))[0] == DeploymentStatus.ERROR
+
+
+def test_deployment_id_from_internal_name():
+    assert get_deployment_id('d-7-model') == 7
+    assert get_deployment_id('s-7-model') == 7
+    assert get_deployment_id('kube-dns') is None
+
+
+def test_rollout_version_from_label():
+    deployment = _deployment(2)
+    assert rollout_version(deployment) is None
+    deployment.metadata.labels = {DEPLOYMENT_LABEL: '12'}
+    assert rollout_version(deployment) == 12
+
+
+def test_changes_are_merged():
+    merged = merge_changes(
+        StatusChange(7, DeploymentStatus.PENDING, 'Rolling out', port=31000,
+                     version=2),
+        StatusChange(7, port=31001))
+    assert merged == StatusChange(7, DeploymentStatus.PENDING, 'Rolling out',
+                                  31001, 2)
+    merged = merge_changes(merged, StatusChange(
+        7, DeploymentStatus.DEPLOYED, 'Available', version=3))
+    assert merged == StatusChange(7, DeploymentStatus.DEPLOYED, 'Available',
+                                  31001, 3)
+
+
+def test_unmanaged_status_is_kept():
+    deployment = Deployment(
+        id=7, current_status=DeploymentStatus.PENDING_UNDEPLOY, port=31000)
+    change = StatusChange(7, DeploymentStatus.ERROR, 'Crashing', 31001)
+    assert apply_change(deployment, change) == (True, None)
+    assert deployment.current_status == DeploymentStatus.PENDING_UNDEPLOY
+    assert deployment.port == 31001
+
+    deployment.current_status = DeploymentStatus.DEPLOYED
+    assert apply_change(deployment, change) == (True, 'Crashing')
+    assert deployment.current_status == DeploymentStatus.ERROR
+    # No change
+    assert apply_change(deployment, change) == (False, None)
+
+
+def test_change_finishes_rollout_of_its_version():
+    app = Flask(__name__)
+    create_babel(app)
+    deployment = Deployment(
+        id=7, current_status=DeploymentStatus.DEPLOYED_OLD)
+    rollout = DeploymentRollout(
+        version=3, started=datetime.datetime.utcnow())
+    with app.app_context():
+        # Change of the previous version
+        assert apply_change(deployment, StatusChange(
+            7, DeploymentStatus.DEPLOYED, 'Available', version=2),
+            rollout) == (False, None)
+        assert rollout.finished is None
+
+        changed, message = apply_change(deployment, StatusChange(
+            7, DeploymentStatus.DEPLOYED, 'Available', version=3), rollout)
+    assert changed and message.startswith('Available Ready in')
+    assert deployment.current_status == DeploymentStatus.DEPLOYED
+    assert rollout.status == DeploymentStatus.DEPLOYED
+    assert rollout.time_to_ready is not None
+
+
+def test_changes_are_kept_when_flush_fails():
+    reconciler = Reconciler(Flask(__name__))
+    written = []
+
+    def write(pending):
+        if not written:
+            written.append(None)
+            raise OperationalError('UPDATE', {}, Exception('Lost connection'))
+        written.append(dict(pending))
+        return len(pending), set()
+
+    reconciler._write = write
+    reconciler.changes.put(StatusChange(7, DeploymentStatus.DEPLOYED,
+                                        'Available', version=2))
+    with pytest.raises(OperationalError):
+        reconciler.flush()
+
+    reconciler.changes.put(StatusChange(7, port=31001))
+    assert reconciler.flush() == 1
+    assert written[1] == {7: StatusChange(7, DeploymentStatus.DEPLOYED,
+                                          'Available', 31001, 2)}
+    assert reconciler.flush() == 0
+
+
+def test_watch_stops_when_target_is_disabled(monkeypatch):
+    targets = [SimpleNamespace(id=1, url='https://k8s', namespace='a'),
+               SimpleNamespace(id=2, url='https://k8s', namespace='b')]
+    query = SimpleNamespace(filter=lambda *args: SimpleNamespace(
+        all=lambda: list(targets)))
+    monkeypatch.setattr(reconciler, 'DeploymentTarget', SimpleNamespace(
+        query=query, enabled=True, target_type=None))
+    api = SimpleNamespace(api_client=None, list_namespaced_deployment=None)
+    monkeypatch.setattr(reconciler.jobs, 'get_api',
+                        lambda target, gettext: api)
+    watches = []
+    instance = Reconciler(Flask(__name__))
+    instance._start = lambda list_func, namespace, handler, cache, stop, \
+        *args: watches.append((namespace, stop))
+
+    instance._watch_targets()
+    instance._watch_targets()
+    assert [namespace for namespace, _ in watches] == ['a', 'a', 'b', 'b']
+    assert not any(stop.is_set() for _, stop in watches)
+
+    targets.pop()
+    instance._watch_targets()
+    assert [namespace for namespace, stop in watches
+            if stop.is_set()] == ['b', 'b']
+    instance.stop()
+    assert all(stop.is_set() for _, stop in watches)
@@ -0,0 +1,128 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+from flask import Flask
+
+from seed import rq, scheduling
+from seed.scheduling import (ApiRateLimiter, TargetWorker, get_target_id,
+                             target_queue_name)
+
+
+def test_target_queue_name_identifies_target():
+    assert get_target_id(target_queue_name(12)) == 12
+    assert get_target_id('seed') is None
+    assert get_target_id('seed.target.') is None
+
+
+@pytest.fixture
+def worker(monkeypatch):
+    """TargetWorker with limits already loaded (target 1: 2 jobs, target 2:
+    unlimited) and jobs running per queue in `running`"""
+    running = {}
+
+    class Registry:
+        def __init__(self, name, connection=None):
+            self.count = running.get(name, 0)
+
+    monkeypatch.setattr(scheduling, 'StartedJobRegistry', Registry)
+    worker = TargetWorker.__new__(TargetWorker)
+    worker.connection = None
+    worker.job_class = worker.serializer = None
+    worker._limits = {1: 2, 2: 0}
+    worker._limits_loaded = time.monotonic()
+    worker.running = running
+    with Flask(__name__).app_context():
+        yield worker
+
+
+def _queue(name):
+    return SimpleNamespace(name=name)
+
+
+def test_saturated_target_is_skipped(worker):
+    queue = _queue(target_queue_name(1))
+    worker.running[queue.name] = 1
+    assert not worker._is_saturated(queue)
+    worker.running[queue.name] = 2
+    assert worker._is_saturated(queue)
+    # Default queue has no limit
+    worker.running['seed'] = 10
+    assert not worker._is_saturated(_queue('seed'))
+
+
+def test_zero_max_running_jobs_is_unlimited(worker):
+    queue = _queue(target_queue_name(2))
+    worker.running[queue.name] = 100
+    assert not worker._is_saturated(queue)
+
+
+def test_queues_are_served_in_round_robin(worker, monkeypatch):
+    names = [target_queue_name(i) for i in (1, 2, 3)]
+    monkeypatch.setattr(scheduling.Queue, 'all',
+                        lambda **kwargs: [_queue(n) for n in names])
+    monkeypatch.setattr(worker, '_enqueue_scheduled_jobs', lambda q: None)
+    worker._base_queues = [_queue('seed')]
+    worker._last_queue = None
+
+    worker._refresh_queues()
+    assert [q.name for q in worker._ordered_queues] == ['seed'] + names
+
+    worker.reorder_queues(_queue(names[0]))
+    worker.running[names[0]] = 2
+    worker._refresh_queues()
+    # Starts after the last queue served, skipping the saturated target
+    assert [q.name for q in worker._ordered_queues] == [
+        names[1], names[2], 'seed']
+
+
+class _Pipeline:
+    counts = {}
+
+    def __enter__(self):
+        self.commands = []
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def incr(self, key):
+        self.commands.append(key)
+
+    def expire(self, key, seconds):
+        pass
+
+    def execute(self):
+        key = self.commands[0]
+        self.counts[key] = self.counts.get(key, 0) + 1
+        return [self.counts[key]]
+
+
+def test_rate_limiter_blocks_when_limit_is_reached(monkeypatch):
+    clock = [1000.25]
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        clock[0] += seconds
+
+    _Pipeline.counts = {}
+    monkeypatch.setattr(rq, '_connection',
+                        SimpleNamespace(pipeline=_Pipeline))
+    monkeypatch.setattr(scheduling.time, 'time', lambda: clock[0])
+    monkeypatch.setattr(scheduling.time, 'sleep', sleep)
+
+    limiter = ApiRateLimiter(1, rate=2)
+    limiter.acquire()
+    limiter.acquire()
+    assert sleeps == []
+    # Third call in the same second waits for the next one
+    limiter.acquire()
+    assert sleeps == [0.75]
+    assert limiter.throttled == 1
+    assert _Pipeline.counts == {'seed:target:1:api:1000': 3,
+                                'seed:target:1:api:1001': 1}
+
+    # No limit: Redis is not used
+    ApiRateLimiter(1, rate=None).acquire()
+    assert sum(_Pipeline.counts.values()) == 4
@@ -0,0 +1,21 @@
+from seed.schema import (DeploymentCreateRequestSchema,
+                         DeploymentListResponseSchema, get_schema,
+                         partial_schema_factory)
+
+
+def test_get_schema_reuses_instance_per_projection():
+    schema = get_schema(DeploymentListResponseSchema, many=True,
+                        only=['name', 'id'])
+    assert schema is get_schema(DeploymentListResponseSchema, many=True,
+                                only=('id', 'name'))
+    assert schema.many
+    assert set(schema.fields.keys()) == {'id', 'name'}
+    assert schema is not get_schema(DeploymentListResponseSchema, many=True)
+    assert schema is not get_schema(DeploymentListResponseSchema,
+                                    only=['id', 'name'])
+
+
+def test_partial_schema_is_cached():
+    schema = partial_schema_factory(DeploymentCreateRequestSchema)
+    assert schema.partial
+    assert schema is partial_schema_factory(DeploymentCreateRequestSchema)
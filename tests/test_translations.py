@@ -0,0 +1,10 @@
+from seed import translations
+
+
+def test_translations_are_loaded_once_per_locale():
+    assert translations.get_translations('pt') is \
+        translations.get_translations('pt')
+    # No catalog: message is not translated, but is formatted
+    gettext = translations.get_gettext('xx')
+    assert gettext('%(name)s not found', name='Deployment') == \
+        'Deployment not found'